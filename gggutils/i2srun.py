@@ -128,6 +128,8 @@ def _concat_i2s_run_files(i2s_files, last_header_param=runutils._default_last_he
 
     :returns: list of header lines and list of run lines
     """
+    runutils._prefetch_files(i2s_files)
+
     # Read all the header info from the first file
     header_lines = []
     with open(i2s_files[0]) as robj:
@@ -1,3 +1,8 @@
+from functools import lru_cache, partial
+import io
+import mmap
+import os
+from multiprocessing import Pool
 import netCDF4 as ncdf
 import numpy as np
 import pandas as pd
@@ -7,11 +12,35 @@ from jllutils.fileops import ncio
 
 from typing import Sequence, Union
 
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+try:
+    import pyarrow
+except ImportError:
+    _eof_csv_engine = 'c'
+else:
+    # The pyarrow CSV reader tokenizes in parallel and is noticeably faster on the wide .eof.csv files
+    _eof_csv_engine = 'pyarrow'
+
+# Columns of .eof.csv files needed to compute the dates and filter on quality flag
+_eof_required_cols = ('year', 'day', 'hour', 'flag')
+
+_fpit_date_re = re.compile(rb'(?<=FPIT_)\d{10}(?=Z)')
+_next_spec_re = re.compile(rb'next spectrum', re.IGNORECASE)
+
 
 class MavParsingError(Exception):
     pass
 
 
+@lru_cache(maxsize=256)
+def _year_start(year: int) -> pd.Timestamp:
+    return pd.Timestamp(year, 1, 1)
+
+
 def ydh_to_timestamp(year: int, day: int, hour: Union[int, float], has_decimal=False) -> pd.Timestamp:
     """
     Convert a single year, day, and fractional hour into a Pandas timestamp.
@@ -39,7 +68,29 @@ def ydh_to_timestamp(year: int, day: int, hour: Union[int, float], has_decimal=F
     else:
         year = int(year)
         day = int(day)
-    return pd.Timestamp(year, 1, 1) + pd.Timedelta(days=day - 1, hours=hour)
+    return _year_start(year) + pd.Timedelta(days=day - 1, hours=hour)
+
+
+def _normalize_ydh_numpy(year: np.ndarray, day: np.ndarray, hour: np.ndarray):
+    # Array version of the decimal year/day normalization in ydh_to_timestamp.
+    # np.round rounds half to even, same as the builtin round.
+    year_out = np.round(year - 0.99*(day / 366)).astype(np.int64)
+    day_out = np.round(day - 0.99*(hour / 24)).astype(np.int64)
+    return year_out, day_out
+
+
+if njit is not None:
+    @njit(parallel=True, cache=True)
+    def _normalize_ydh(year, day, hour):
+        n = year.shape[0]
+        year_out = np.empty(n, dtype=np.int64)
+        day_out = np.empty(n, dtype=np.int64)
+        for i in prange(n):
+            year_out[i] = int(round(year[i] - 0.99*(day[i] / 366)))
+            day_out[i] = int(round(day[i] - 0.99*(hour[i] / 24)))
+        return year_out, day_out
+else:
+    _normalize_ydh = _normalize_ydh_numpy
 
 
 def df_ydh_to_dtind(df: pd.DataFrame, has_decimal=False) -> pd.DatetimeIndex:
@@ -49,7 +100,18 @@ def df_ydh_to_dtind(df: pd.DataFrame, has_decimal=False) -> pd.DatetimeIndex:
      fractional hour of their rows.
     :return: a DatetimeIndex with the corresponding datetimes.
     """
-    return pd.DatetimeIndex([ydh_to_timestamp(y, d, h, has_decimal=has_decimal) for y, d, h in zip(df.year, df.day, df.hour)])
+    # Same calculation as ydh_to_timestamp, but done on the whole arrays at once
+    # rather than building a Timestamp for each row.
+    hour = np.asarray(df.hour, dtype=np.float64)
+    if has_decimal:
+        year, day = _normalize_ydh(np.asarray(df.year, dtype=np.float64), np.asarray(df.day, dtype=np.float64), hour)
+    else:
+        year = np.asarray(df.year).astype(np.int64)
+        day = np.asarray(df.day).astype(np.int64)
+
+    year_start = (year - 1970).astype('datetime64[Y]').astype('datetime64[ns]')
+    offset = (day - 1) * np.int64(86400 * 10**9) + np.round(hour * 3.6e12).astype(np.int64)
+    return pd.DatetimeIndex(year_start + offset.astype('timedelta64[ns]'))
 
 
 def _read_private_nc(ncfile: str, date_index: bool = True):
@@ -62,28 +124,30 @@ def _read_private_nc(ncfile: str, date_index: bool = True):
         df.reset_index(drop=True, inplace=True)
     
     with ncdf.Dataset(ncfile) as ds:
-        # Read the spectrum name
-        if 'spectrum' in ds.variables:
-            df['spectrum'] = ds.variables['spectrum'][:]
-        
-        # Find all variables with _Encoding as an attribute -
-        # those are text variables
-        for varname, var in ds.variables.items():
-            if '_Encoding' in var.ncattrs():
-                df[varname] = var[:]
-                
-    return df
-
-
-def _read_eof_csv(eof_file: str, date_index: bool = True, compute_date: bool = True):
-    with open(eof_file, 'r') as robj:
-        line1 = robj.readline()
-        if ',' in line1:
-            line1 = line1.split(',')
-        else:
-            line1 = line1.split()
-        nhead = int(line1[0])
-    df = pd.read_csv(eof_file, header=nhead - 1, sep=',')
+        # Read the spectrum name and all variables with _Encoding as an 
+        # attribute - those are text variables
+        text_cols = {varname: var[:] for varname, var in ds.variables.items()
+                     if varname == 'spectrum' or '_Encoding' in var.ncattrs()}
+
+    # Add all the text columns at once rather than inserting them one by one
+    return df.assign(**text_cols)
+
+
+def _read_eof_csv(eof_file: str, date_index: bool = True, compute_date: bool = True, usecols: Sequence[str] = None):
+    with open(eof_file, 'rb') as robj:
+        nhead = _parse_num_header_lines(robj.readline().decode())
+        # Skip the rest of the header up to the column names, then let pandas
+        # read from the same handle rather than opening the file again.
+        for i in range(nhead - 2):
+            robj.readline()
+        if usecols is not None:
+            # Peek at the column names so that requested columns not in this
+            # file can be left out rather than making pandas raise an error
+            pos = robj.tell()
+            colnames = robj.readline().decode().rstrip('\r\n').split(',')
+            robj.seek(pos)
+            usecols = select_eof_columns(colnames, usecols)
+        df = pd.read_csv(robj, sep=',', engine=_eof_csv_engine, usecols=usecols)
 
 
     if date_index:
@@ -94,8 +158,30 @@ def _read_eof_csv(eof_file: str, date_index: bool = True, compute_date: bool = T
     return df
 
 
+def select_eof_columns(columns: Sequence[str], usecols: Sequence[str]) -> list:
+    """Select which columns of a .eof.csv file to read
+
+    Parameters
+    ----------
+    columns:
+        the columns in the file, in order.
+
+    usecols:
+        the columns requested. Names not in `columns` are ignored.
+
+    Returns
+    -------
+    list:
+        the requested columns that are in `columns`, plus the year, day, hour, and flag columns that are always needed
+        for the dates and quality filtering, in the order they are in `columns`.
+    """
+    usecols = set(usecols).union(_eof_required_cols)
+    return [c for c in columns if c in usecols]
+
+
 def read_eng_file(private_file: str, date_index: bool = True, compute_date: bool = True, 
-                  allowed_flags: Sequence[int] = (0,), dates: pd.DatetimeIndex = None) -> pd.DataFrame:
+                  allowed_flags: Sequence[int] = (0,), dates: pd.DatetimeIndex = None,
+                  usecols: Sequence[str] = None) -> pd.DataFrame:
     """Read a .eof.csv (engineering output file, comma-separated value format) file
 
     Parameters
@@ -118,6 +204,11 @@ def read_eng_file(private_file: str, date_index: bool = True, compute_date: bool
         kept. If this is `None`, no date limiting is done. If this is given, `compute_date` is considered `True` regardless
         of its actual value.
 
+    usecols:
+        names of the columns to read from a .eof.csv file. Names that are not in the file are ignored, and the year,
+        day, hour, and flag columns are always read since they are needed for the dates and quality filtering. If
+        `None` (default), all columns are read. Has no effect if reading a netCDF file.
+
     Returns
     -------
     pd.DataFrame:
@@ -126,22 +217,41 @@ def read_eng_file(private_file: str, date_index: bool = True, compute_date: bool
     if private_file.endswith('.nc') or private_file.endswith('.nc4'):
         df = _read_private_nc(private_file, date_index=date_index)
     else:
-        df = _read_eof_csv(private_file, date_index=date_index, compute_date=compute_date)
-    
-    if allowed_flags is None or allowed_flags == 'all':
-        xx = df['flag'] > -99 
-    else:
-        xx = df['flag'].isin(allowed_flags)
+        df = _read_eof_csv(private_file, date_index=date_index, compute_date=compute_date or dates is not None,
+                           usecols=usecols)
 
+    unsorted_dates = None
     if dates is not None:
         if date_index:
-            df_dates = this_df.index
+            df_dates = df.index
         else:
-            df_dates = this_df['date']
-            
-        xx &= (this_df['date'] >= dates.min()) & (this_df['date'] <= dates.max())
+            df_dates = pd.DatetimeIndex(df['date'])
+
+        if df_dates.is_monotonic_increasing:
+            # Files are normally in time order, so the date range can be found with
+            # a binary search and sliced out without comparing every row.
+            istart = df_dates.searchsorted(dates.min(), side='left')
+            iend = df_dates.searchsorted(dates.max(), side='right')
+            df = df.iloc[istart:iend]
+        else:
+            # Otherwise the date comparison gets folded into the flag mask below
+            unsorted_dates = df_dates.to_numpy()
+    
+    # Build the mask on the underlying array; the common case of a single allowed
+    # flag doesn't need the general set membership test.
+    flags = df['flag'].to_numpy()
+    if allowed_flags is None or allowed_flags == 'all':
+        xx = flags > -99 
+    elif len(allowed_flags) == 1:
+        xx = flags == next(iter(allowed_flags))
+    else:
+        xx = np.isin(flags, np.asarray(list(allowed_flags)))
+
+    if unsorted_dates is not None:
+        np.logical_and(xx, unsorted_dates >= np.datetime64(dates.min()), out=xx)
+        np.logical_and(xx, unsorted_dates <= np.datetime64(dates.max()), out=xx)
     
-    return df[xx]
+    return df.iloc[np.flatnonzero(xx)]
 
 # may finish this in the future to avoid screen dumping hundreds of
 # pandas tables when accidentally printing the mav dict. Also make it
@@ -177,28 +287,88 @@ class MavContainer(object):
             
 
 
-def read_mav_file(mav_file, indexing='spectrum'):
-    def specname(l):
-        return l.split(':')[1].strip()
+def read_mav_file(mav_file, indexing='spectrum', cache=False, output='dict'):
+    """Read a .mav file into a dictionary of dataframes, one per block
 
-    mav_dict = dict()
+    Parameters
+    ----------
+    mav_file : pathlike
+        The path to the .mav file to read.
 
-    with open(mav_file, 'r') as robj:
-        # Find the first "Next Spectrum" line
-        while True:
-            address = robj.tell()
-            line = robj.readline()
-            if 'next spectrum' in line.lower():
-                break
+    indexing : str
+        How to key the returned dictionary. `'spectrum'` (default) uses the spectrum names, `'datetime'`
+        uses the times of the FPIT model files.
+
+    cache : bool
+        If `True`, the parsed blocks are saved to a Parquet file next to the .mav file (with the
+        extension ``.<indexing>.parquet`` appended, or ``.<indexing>-long.parquet`` for long output)
+        and later calls read that instead as long as it is newer than the .mav file. Requires pyarrow
+        or fastparquet.
+
+    output : str
+        `'dict'` (default) returns a dictionary of dataframes. `'long'` instead returns all the blocks in
+        a single dataframe indexed by spectrum name (as a categorical) or datetime, depending on `indexing`.
+        This is much faster for files with many blocks, but requires all blocks to have the same columns.
+
+    Returns
+    -------
+    dict or pandas.DataFrame
+        The mav blocks as dataframes.
+    """
+    if output == 'dict':
+        cache_file = Path('{}.{}.parquet'.format(mav_file, indexing))
+    elif output == 'long':
+        cache_file = Path('{}.{}-long.parquet'.format(mav_file, indexing))
+    else:
+        raise ValueError('Unknown output type: {}'.format(output))
+
+    if cache and cache_file.exists() and cache_file.stat().st_mtime > Path(mav_file).stat().st_mtime:
+        if output == 'long':
+            return pd.read_parquet(cache_file)
+        else:
+            return _read_mav_cache(cache_file)
+
+    if output == 'long':
+        mav_table = _read_mav_long(mav_file, indexing=indexing)
+        if cache:
+            mav_table.to_parquet(cache_file)
+        return mav_table
+
+    mav_dict = _read_mav_blocks(mav_file, indexing=indexing)
+    if cache and len(mav_dict) > 0:
+        _write_mav_cache(cache_file, mav_dict)
+    return mav_dict
+
+
+def _read_mav_cache(cache_file):
+    df = pd.read_parquet(cache_file)
+    return {k: table.drop(columns='_mav_key') for k, table in df.groupby('_mav_key', sort=False)}
+
+
+def _write_mav_cache(cache_file, mav_dict):
+    # Store all the blocks in one long table with the dictionary key as an extra column
+    df = pd.concat([table.assign(_mav_key=k) for k, table in mav_dict.items()])
+    df.to_parquet(cache_file)
+
+
+def _find_first_mav_block(mm, mav_file):
+    # Find the first "Next Spectrum" line and return the position of the start of it
+    m = _next_spec_re.search(mm)
+    if m is None:
+        raise MavParsingError('Could not find a line containing "Next Spectrum" in {}'.format(mav_file))
+    return mm.rfind(b'\n', 0, m.start()) + 1
 
-        # Rewind so that the file pointer is aimed at the
-        # "next spectrum" line
-        robj.seek(address)
+
+def _read_mav_blocks(mav_file, indexing):
+    mav_dict = dict()
+
+    with open(mav_file, 'rb') as robj, mmap.mmap(robj.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos = _find_first_mav_block(mm, mav_file)
         
         # Read mav blocks until we run out
         nread = 0
         while True:
-            idx, table = _parse_mav_block(robj, indexing=indexing)
+            idx, table, pos = _parse_mav_block(mm, pos, indexing=indexing)
             nread += 1
             print('\rRead {} mav blocks'.format(nread), end='')
             if idx is None:
@@ -208,53 +378,135 @@ def read_mav_file(mav_file, indexing='spectrum'):
             mav_dict[idx] = table
 
 
+def _read_mav_long(mav_file, indexing, exclude_cell=True):
+    # Rather than parsing each block into its own dataframe, gather the data lines
+    # of all the blocks and parse them in one go.
+    keys = []
+    nrows = []
+    chunks = []
+    column_line = None
+
+    with open(mav_file, 'rb') as robj, mmap.mmap(robj.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos = _find_first_mav_block(mm, mav_file)
+        while True:
+            idx, table_start, pos = _parse_mav_block_header(mm, pos, indexing=indexing)
+            if idx is None:
+                break
+
+            data_start = _skip_lines(mm, table_start, 1)
+            if column_line is None:
+                column_line = mm[table_start:data_start]
+            elif mm[table_start:data_start].split() != column_line.split():
+                raise MavParsingError('Block for {} has different columns than the first block; use dict output '
+                                      'for this file'.format(idx))
+
+            chunk = mm[data_start:pos]
+            if not chunk.endswith(b'\n'):
+                chunk += b'\n'
+            keys.append(idx)
+            nrows.append(chunk.count(b'\n'))
+            chunks.append(chunk)
+            print('\rRead {} mav blocks'.format(len(keys)), end='')
+    print('')
+
+    if column_line is None:
+        return pd.DataFrame()
+
+    table = pd.read_csv(io.BytesIO(column_line + b''.join(chunks)), sep=r'\s+', engine='c')
+    if indexing == 'spectrum':
+        codes, categories = pd.factorize(np.array(keys, dtype=object))
+        index = pd.CategoricalIndex(pd.Categorical.from_codes(np.repeat(codes, nrows), categories=categories), name='spectrum')
+    else:
+        index = pd.DatetimeIndex(np.repeat(np.array(keys, dtype='datetime64[ns]'), nrows), name='datetime')
+    table.index = index
+
+    if exclude_cell:
+        table = table[table['Height'].to_numpy() > -2]
+    return table
+
+
+def _skip_lines(mm, pos, nlines):
+    # Advance the position in a memory-mapped file past `nlines` lines
+    # without creating strings for them. Stops at the end of the file.
+    for i in range(nlines):
+        pos = mm.find(b'\n', pos)
+        if pos < 0:
+            return len(mm)
+        pos += 1
+    return pos
+
 
+def _read_line(mm, pos):
+    # Return the line starting at `pos` (as bytes) and the position of
+    # the following line.
+    end = _skip_lines(mm, pos, 1)
+    return mm[pos:end], end
+
+
+def _parse_mav_block_header(mm, pos, indexing='spectrum'):
+    # Parse the header of the mav block starting at `pos`. Returns the key for the block,
+    # the position where its table (including the column names) starts, and the position
+    # after the end of the block.
 
-def _parse_mav_block(fh, exclude_cell=True, indexing='spectrum'):
     # The first line should have 'Next Spectrum:<specname>'. Get the spectrum name, or
     # raise an error if not
-
-    line = fh.readline()
+    line, pos = _read_line(mm, pos)
     if len(line) == 0:
         # End of file
-        return None, None
-    elif 'next spectrum' not in line.lower():
+        return None, None, pos
+    elif not _next_spec_re.search(line):
         raise MavParsingError('MAV block did not start with line containing "Next Spectrum"')
     else:
-        specname = line.split(':')[1].strip()
+        specname = line.split(b':')[1].strip().decode()
 
     
-    count_line = fh.readline()
-    nhead, ncol, nrow = [int(x) for x in count_line.split()]
+    count_line, pos = _read_line(mm, pos)
+    nhead, ncol, nrow = map(int, count_line.split())
+
+    # Advance to the second to last line of the header - the line we just read counts.
+    # Only that line is needed, the ones before it can be skipped over.
+    if nhead > 2:
+        pos = _skip_lines(mm, pos, nhead-3)
+        line, pos = _read_line(mm, pos)
+    else:
+        line = count_line
 
-    # Advance to the second to last line of the header - the line we just read counts
-    for i in range(nhead-2):
-        line = fh.readline()
+    # Pandas does not count the header for nrows, neither does the .mav file. 
+    table_start = pos
+    pos = _skip_lines(mm, pos, nrow + 1)
 
-    # The second to last line should include the FPIT mod file name - get the date from that
-    m = re.search(r'(?<=FPIT_)\d{10}(?=Z)', line)
-    if m is None and indexing == 'datetime':
-        raise MavParsingError('Could not find FPIT model file to get the datetime from')
+    if indexing == 'spectrum':
+        return specname, table_start, pos
+    elif indexing == 'datetime':
+        # The second to last line should include the FPIT mod file name - get the date from that
+        m = _fpit_date_re.search(line)
+        if m is None:
+            raise MavParsingError('Could not find FPIT model file to get the datetime from')
+        return pd.to_datetime(m.group().decode(), format='%Y%m%d%H'), table_start, pos
     else:
-        specdate = pd.to_datetime(m.group(), format='%Y%m%d%H')
+        raise ValueError('Unknown indexing type: {}'.format(indexing))
+
 
-    # Pandas does not count the header for nrows, neither does the .mav file. Also the C 
-    # engine reads in chunks and so can go past the end of the mav block. The python 
-    # engine is slower but behaves correctly.
-    table = pd.read_csv(fh, sep='\s+', nrows=nrow, engine='python')
+def _parse_mav_block(mm, pos, exclude_cell=True, indexing='spectrum'):
+    idx, table_start, pos = _parse_mav_block_header(mm, pos, indexing=indexing)
+    if idx is None:
+        return None, None, pos
+
+    # The C engine reads in chunks and so can go past the end of the mav block if given 
+    # the whole file, so slice out exactly the column header plus nrow lines ourselves
+    # and hand that to the (much faster) C engine.
+    table = pd.read_csv(io.BytesIO(mm[table_start:pos]), sep=r'\s+', engine='c')
 
     # Cell concentrations are represented by negative altitudes (-9.9 and -8.8 km)
     # Unless told not to, remove those levels
     if exclude_cell:
-        xx = table['Height'] > -2  # technically if we had a TCCON in Death Valley it should have a negative altitude...
-        table = table[xx]
+        # technically if we had a TCCON in Death Valley it should have a negative altitude...
+        # The cell levels come first, so normally we can just slice them off.
+        keep = table['Height'].to_numpy() > -2
+        istart = np.argmax(keep)
+        table = table.iloc[istart:] if keep[istart:].all() else table[keep]
 
-    if indexing == 'spectrum':
-        return specname, table
-    elif indexing == 'datetime':
-        return specdate, table
-    else:
-        raise ValueError('Unknown indexing type: {}'.format(indexing))
+    return idx, table, pos
 
 
 def read_out_file(out_file, as_dataframes=True):
@@ -274,8 +526,11 @@ def read_out_file(out_file, as_dataframes=True):
     pandas.DataFrame or dict:
         The data from the file.
     """
-    n_header_lines = _get_num_header_lines(out_file)
-    df = pd.read_csv(out_file, header=n_header_lines-1, sep=r'\s+')
+    with open(out_file, 'r') as robj:
+        n_header_lines = _parse_num_header_lines(robj.readline())
+        for i in range(n_header_lines - 2):
+            robj.readline()
+        df = pd.read_csv(robj, sep=r'\s+')
     if not as_dataframes:
         return df.to_dict()
     else:
@@ -302,6 +557,12 @@ def _get_num_header_lines(filename):
     with open(filename, 'r') as fobj:
         header_info = fobj.readline()
 
+    return _parse_num_header_lines(header_info)
+
+
+def _parse_num_header_lines(header_info):
+    # The first line of a standard GGG file may be comma- or space-separated,
+    # the number of header lines is always the first value.
     if ',' in header_info:
         header = header_info.split(',')
     else:
@@ -343,78 +604,151 @@ def read_spt(spt_file, convert_transmittance=True):
     return df
 
 
-def read_multi_nc_dataframe(nc_files: Sequence[str], variables: Sequence[str], flag0_only: bool = False, quiet: bool = False):
-    data = {v: [] for v in variables}
-    data['file'] = []
+def read_multi_nc_dataframe(nc_files: Sequence[str], variables: Sequence[str], flag0_only: bool = False, quiet: bool = False,
+                            nprocs: int = 1):
+    # Query all the files for how many values they will contribute first, so that
+    # the output arrays can be allocated once and filled in place rather than
+    # holding a list of arrays per variable and concatenating them at the end.
+    masks = []
+    nkept = []
+    dtypes = dict()
+    trailing_shapes = dict()
+    for nc_file in nc_files:
+        with ncdf.Dataset(nc_file) as ds:
+            if flag0_only and 'flag' in ds.variables.keys():
+                qq = np.ma.getdata(ds['flag'][:] == 0)
+                nkept.append(int(np.count_nonzero(qq)))
+            else:
+                # No filtering needed, so skip creating and indexing with an all-true mask
+                qq = None
+                nkept.append(ds.dimensions['time'].size)
+            masks.append(qq)
+
+            for v in variables:
+                # Size the output from the values netCDF4 returns rather than what is stored on disk: packed
+                # variables are unpacked to floats, character arrays with an _Encoding become strings, and
+                # variable-length strings come back as Python objects.
+                sample = ds[v][:1]
+                dtypes[v] = np.result_type(dtypes[v], sample.dtype) if v in dtypes else sample.dtype
+                trailing_shapes.setdefault(v, sample.shape[1:])
+
+    ntotal = sum(nkept)
+    data = {v: np.empty((ntotal,) + trailing_shapes[v], dtype=dtypes[v]) for v in variables}
+
+    read_args = [(nc_file, variables, qq) for nc_file, qq in zip(nc_files, masks)]
+    if nprocs <= 1:
+        _fill_multi_nc_arrays(data, map(_read_nc_variables, read_args), nc_files, nkept, quiet)
+    else:
+        # The netCDF/HDF5 libraries are not thread safe, so parallelize over processes. imap
+        # returns the files in order, so each can still go straight into its slice.
+        with Pool(processes=nprocs) as pool:
+            _fill_multi_nc_arrays(data, pool.imap(_read_nc_variables, read_args), nc_files, nkept, quiet)
+
+    # Store the file names as a categorical so that each row only needs an integer code
+    # rather than a reference to a repeated string.
+    file_codes, file_names = pd.factorize(np.array([str(f) for f in nc_files]))
+    data['file'] = pd.Categorical.from_codes(np.repeat(file_codes, nkept), categories=file_names)
+    return pd.DataFrame(data)
+
+
+def _read_nc_variables(args):
+    nc_file, variables, qq = args
+    with ncdf.Dataset(nc_file) as ds:
+        if qq is None:
+            return {v: ds[v][:] for v in variables}
+        else:
+            return {v: ds[v][:][qq] for v in variables}
+
+
+def _fill_multi_nc_arrays(data, file_data, nc_files, nkept, quiet):
     msg_width = 0
     nfile = len(nc_files)
-    for ifile, nc_file in enumerate(nc_files):
+    istart = 0
+    for ifile, (nc_file, n, this_data) in enumerate(zip(nc_files, nkept, file_data)):
         msg = f'\rReading {Path(nc_file).name} ({ifile+1} of {nfile})'
         if not quiet:
             msg_width = max(msg_width, len(msg))
             print(msg.ljust(msg_width), end='')
-        with ncdf.Dataset(nc_file) as ds:
-            if flag0_only and 'flag' in ds.variables.keys():
-                qq = ds['flag'][:] == 0
-            else:
-                qq = np.ones(ds['time'].shape, dtype=bool)
+        for v, values in this_data.items():
+            data[v][istart:istart+n] = values
+        istart += n
 
-            for v in variables:
-                data[v].append(ds[v][:][qq])
-
-        data['file'].append(np.full(qq.shape, str(nc_file)))
 
-    # This could be more efficient if we queried all the files for their lengths first,
-    # then preallocated numpy arrays and inserted the values, but that's also way more
-    # complex.
-    data = {k: np.concatenate(v) for k, v in data.items()}
-    return pd.DataFrame(data)
+def read_multi_nc_xarray(nc_files: Sequence[str], variables: Sequence[str], flag0_only: bool = False, quiet: bool = False,
+                         lazy: bool = False):
+    """Read variables from multiple netCDF files into one xarray Dataset
 
+    Parameters
+    ----------
+    nc_files
+        The netCDF files to read.
+    variables
+        The variables to read from each file. Variables are concatenated along their first dimension.
+    flag0_only
+        If ``True``, only keep "time" entries with a flag of 0.
+    quiet
+        If ``True``, do not print progress messages.
+    lazy
+        If ``False`` (default), all data is read into memory and the files are closed before returning. If ``True``,
+        the files are opened in parallel with :func:`xarray.open_mfdataset` and the returned dataset is backed by dask
+        arrays, so data is only read when needed. The files stay open until the dataset is closed. Requires dask.
 
-def read_multi_nc_xarray(nc_files: Sequence[str], variables: Sequence[str], flag0_only: bool = False, quiet: bool = False):
+    Returns
+    -------
+    xarray.Dataset
+        The combined dataset. For variables along the "time" and "prior_time" dimensions, a "time_file" or
+        "prior_time_file" variable records which file each entry came from.
+    """
     try:
         import xarray as xr
     except ImportError:
         raise ImportError('The read_multi_nc_xarray function requires the xarray package')
-    
-    data = {v: [] for v in variables}
-    first_dims = dict()
-    msg_width = 0
-    nfile = len(nc_files)
-    for ifile, nc_file in enumerate(nc_files):
-        with xr.open_dataset(nc_file) as ds:
-            msg = f'\rReading {Path(nc_file).name} ({ifile+1} of {nfile})'
-            if not quiet:
-                msg_width = max(msg_width, len(msg))
-                print(msg.ljust(msg_width), end='')
-            for v in variables:
-                var_data = ds[v]
-            
-                if v not in first_dims:
-                    first_dims[v] = var_data.dims[0]
-                elif first_dims[v] != var_data.dims[0]:
-                    raise ValueError(f'In file {nc_file}, the first dimension of {v} ({var_data.dims[0]}) differs from that of previous files ({first_dims[v]})')
-
-                if not flag0_only:
-                    data[v].append(var_data)
-                elif var_data.dims[0] == 'time' and 'flag' in ds:
-                    qq = ds['flag'] == 0
-                    data[v].append(var_data.isel(time=qq))
-
-            if 'time' in first_dims.values():
-                data.setdefault('time_file', [])
-                data['time_file'].append(
-                    xr.DataArray(np.full(ds.time.shape, str(nc_file)), dims=['time'], coords={'time': ds.time})
-                )
-                if 'time_file' not in first_dims:
-                    first_dims['time_file'] = 'time'
-            if 'prior_time' in first_dims.values():
-                data.setdefault('prior_time_file', [])
-                data['prior_time_file'].append(
-                    xr.DataArray(np.full(ds.prior_time.shape, str(nc_file)), dims=['prior_time'], coords={'prior_time': ds.prior_time})
-                )
-                if 'prior_time_file' not in first_dims:
-                    first_dims['prior_time_file'] = 'prior_time'
-
-    data = {k: xr.concat(v, dim=first_dims[k]) for k, v in data.items()}
-    return xr.Dataset(data)
\ No newline at end of file
+    if lazy:
+        try:
+            import dask  # needed by xr.open_mfdataset
+        except ImportError:
+            raise ImportError('read_multi_nc_xarray with lazy=True requires the dask package')
+
+    with xr.open_dataset(nc_files[0]) as ds:
+        first_dims = {v: ds[v].dims[0] for v in variables}
+
+    # xarray records the normalized path as the source of each dataset; map that back
+    # to the file names as given for the time_file and prior_time_file variables.
+    file_names = {os.path.abspath(os.path.expanduser(str(f))): str(f) for f in nc_files}
+
+    if not quiet:
+        print(f'Reading {len(nc_files)} files')
+
+    # Variables can only be concatenated along one dimension at a time, so handle the variables
+    # that share a first dimension together then merge the groups.
+    group_dims = list(dict.fromkeys(first_dims.values()))
+
+    def select_vars(ds, dim):
+        dim_vars = [v for v in variables if first_dims[v] == dim]
+        for v in dim_vars:
+            if ds[v].dims[0] != dim:
+                raise ValueError(f'In file {ds.encoding["source"]}, the first dimension of {v} ({ds[v].dims[0]}) differs from that of previous files ({dim})')
+
+        sub = ds[dim_vars]
+        if flag0_only and dim == 'time' and 'flag' in ds:
+            sub = sub.isel(time=(ds['flag'] == 0).values)
+        if dim in ('time', 'prior_time'):
+            source = ds.encoding['source']
+            sub[f'{dim}_file'] = xr.DataArray(np.full(sub.sizes[dim], file_names.get(source, source)), dims=[dim])
+        return sub
+
+    combine_kws = dict(data_vars='minimal', coords='minimal', compat='override')
+    if lazy:
+        groups = [xr.open_mfdataset(nc_files, combine='nested', concat_dim=dim, preprocess=partial(select_vars, dim=dim),
+                                    parallel=True, **combine_kws)
+                  for dim in group_dims]
+    else:
+        # Open each file once, reading all the groups' variables into memory before it is closed
+        group_data = {dim: [] for dim in group_dims}
+        for nc_file in nc_files:
+            with xr.open_dataset(nc_file) as ds:
+                for dim in group_dims:
+                    group_data[dim].append(select_vars(ds, dim).load())
+        groups = [xr.concat(group_data[dim], dim=dim, **combine_kws) for dim in group_dims]
+
+    return xr.merge(groups)
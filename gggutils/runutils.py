@@ -1,12 +1,16 @@
+from collections import OrderedDict
 import datetime as dt
+import fnmatch
 from glob import glob
 from logging import getLogger
 import ntpath
 import os
+from pathlib import Path
 import re
 import shutil
 import sys
-import tempfile
+import time
+import weakref
 
 from configobj import ConfigObj, flatten_errors
 from validate import Validator
@@ -17,6 +21,20 @@ from . import exceptions, _etc_dir
 _default_last_header_param = 28
 logger = getLogger('runutils')
 
+# Placeholder for lookups where None is a valid value
+_missing = object()
+
+# Minimum time in seconds between redraws of a ProgressBar
+_progress_flush_interval = 0.05
+
+# Patterns used when parsing files line-by-line. Anything after a colon is a comment in an I2S input file, unless the
+# colon is immediately followed by a backslash (i.e. is part of a Windows path).
+_colon_split_re = re.compile(r':(?=[^\\])')
+_whitespace_re = re.compile(r'\s+')
+_slice_line_re = re.compile(r'\s*\d{4}')
+_date8_re = re.compile(r'\d{8}')
+_ggg_window_re = re.compile(r'^[a-z]+_\d+')
+
 
 class ProgressBar(object):
     """
@@ -66,13 +84,16 @@ class ProgressBar(object):
         if len(suffix) > 0 and not suffix.startswith(' '):
             suffix = ' ' + suffix
 
-        if style == '*':
-            self._fmt_str = '{pre}[{{pstr:<{n}}}]{suf}'.format(pre=prefix, n=num_symbols, suf=suffix)
-        elif style == 'counter':
-            self._fmt_str = '{pre}{{i:>{l}}}/{n}{suf}'.format(pre=prefix, n=num_symbols, suf=suffix, l=len(str(num_symbols)))
-        else:
+        if style not in ('*', 'counter'):
             raise ValueError('style "{}" not recognized'.format(style))
+        self._prefix = '\r' + prefix
+        self._suffix = suffix
+        self._n = num_symbols
+        self._l = len(str(num_symbols))
+        self._style = style
         self._add_one = add_one
+        self._last_flush = 0.0
+        self._pending = None
 
     def print_bar(self, i):
         """
@@ -86,16 +107,30 @@ class ProgressBar(object):
         if self._add_one:
             i += 1
 
-        pstr = '*' * i
-        pbar = self._fmt_str.format(pstr=pstr, i=i)
-        sys.stdout.write('\r' + pbar)
-        sys.stdout.flush()
+        if self._style == '*':
+            pbar = self._prefix + '[' + '*' * i + ' ' * (self._n - i) + ']' + self._suffix
+        else:
+            pbar = f'{self._prefix}{i:>{self._l}}/{self._n}{self._suffix}'
+
+        # Only redraw every so often so that tight loops don't spend their time writing to the terminal. Whatever
+        # the last skipped step was gets written by finish().
+        now = time.monotonic()
+        if i >= self._n or now - self._last_flush >= _progress_flush_interval:
+            sys.stdout.write(pbar)
+            sys.stdout.flush()
+            self._last_flush = now
+            self._pending = None
+        else:
+            self._pending = pbar
 
     def finish(self):
         """
         Close the progress bar. By default, just prints a newline.
         :return: None
         """
+        if self._pending is not None:
+            sys.stdout.write(self._pending)
+            self._pending = None
         sys.stdout.write('\n')
         sys.stdout.flush()
 
@@ -119,7 +154,8 @@ def finalize_target_dirs(target_dirs, dirs_list=None):
 
     if dirs_list is not None:
         with open(dirs_list, 'r') as robj:
-            extra_dirs = [l.strip() for l in robj.readlines()]
+            # skip blank lines (e.g. a trailing newline) rather than adding empty directory names
+            extra_dirs = [d for d in map(str.strip, robj.read().splitlines()) if d]
         target_dirs.extend(extra_dirs)
     return target_dirs
 
@@ -168,67 +204,80 @@ def modify_i2s_input_params(filename, *args, new_file=None, last_header_param=_d
         new_file = filename
     i2s_params = _mod_i2s_args_parsing(args)
 
-    # We'll always write the changes to a temporary file first. That way we keep the code simple, and just which file
-    # it gets copied to changes
-    with tempfile.NamedTemporaryFile('w') as tfile:
-        with open(filename, 'rb') as robj, open(tfile.name, 'w') as wobj:
-            for param_num, subparam_num, value, comment, is_param in iter_i2s_input_params(robj, include_all_lines=True):
+    # Build up the new file contents in memory (I2S input files are small) so that it can be written in one go.
+    # Writing to a temporary file and renaming it means the original is never left half-written.
+    new_lines = []
+    contents = _read_i2s_file(filename)
+    for param_num, subparam_num, value, comment, is_param in iter_i2s_input_params(contents, include_all_lines=True):
+        if is_param:
+            # Line has non-comment, non-whitespace characters. If it was one of the parameters to be changed,
+            # replace the value part. If not, just keep the value as-is.
+            if param_num in i2s_params:
                 curr_param_lines = _nlines_for_param(param_num)
-                if is_param:
-                    # Line has non-comment, non-whitespace characters. If it was one of the parameters to be changed,
-                    # replace the value part. If not, just keep the value as-is.
-                    if param_num in i2s_params:
-                        if len(i2s_params[param_num]) != curr_param_lines:
-                            raise ValueError('Parameter {param} requires {req} lines, only {n} given.'
-                                             .format(param=param_num, req=curr_param_lines, n=len(i2s_params[param_num])))
-                        # to keep things pretty, capture existing whitespace between the value and any trailing comments
-                        trailing_space = re.search(r'\s*$', value).group()
-                        value = i2s_params[param_num][subparam_num-1] + trailing_space
-                    elif param_num > last_header_param:
-                        if not include_input_files:
-                            continue
-                        elif 'chdir' in infile_actions:
-                            value = re.split(r'\s+', value, maxsplit=1)
-                            if re.match(r'\s*\d{4}', value[0]):
-                                logger.info('Not removing opus file directory names in line "{}" because this looks '
-                                            'like a slice file (no file paths)')
-                            # os.path.basename will not split on backslashed on linux. ntpath.basename seems to split
-                            # on forward or backslashes
-                            value[0] = ntpath.basename(value[0])
-                            if isinstance(infile_actions['chdir'], str):
-                                value[0] = os.path.join(infile_actions['chdir'], value[0])
-                            value = ' '.join(value)
-
-                wobj.write(value)
-
-                if len(comment) > 0:
-                    wobj.write(':' + comment)
-
-        shutil.copy(tfile.name, new_file)
+                if len(i2s_params[param_num]) != curr_param_lines:
+                    raise ValueError('Parameter {param} requires {req} lines, only {n} given.'
+                                     .format(param=param_num, req=curr_param_lines, n=len(i2s_params[param_num])))
+                # to keep things pretty, capture existing whitespace between the value and any trailing comments
+                trailing_space = value[len(value.rstrip()):]
+                value = i2s_params[param_num][subparam_num-1] + trailing_space
+            elif param_num > last_header_param:
+                if not include_input_files:
+                    continue
+                elif 'chdir' in infile_actions:
+                    value = _whitespace_re.split(value, maxsplit=1)
+                    if _slice_line_re.match(value[0]):
+                        logger.info('Not removing opus file directory names in line "{}" because this looks '
+                                    'like a slice file (no file paths)')
+                    # os.path.basename will not split on backslashed on linux. ntpath.basename seems to split
+                    # on forward or backslashes
+                    value[0] = ntpath.basename(value[0])
+                    if isinstance(infile_actions['chdir'], str):
+                        value[0] = os.path.join(infile_actions['chdir'], value[0])
+                    value = ' '.join(value)
+
+        new_lines.append(value)
+
+        if len(comment) > 0:
+            new_lines.append(':' + comment)
+
+    # Write to a temporary file and move it into place so that a failed write cannot leave a partial file. The new
+    # file keeps the permissions of the file it replaces (or of the original file if it is a new file).
+    tmp_file = '{}.tmp'.format(new_file)
+    try:
+        with open(tmp_file, 'w') as wobj:
+            wobj.write(''.join(new_lines))
+        shutil.copymode(new_file if os.path.exists(new_file) else filename, tmp_file)
+        os.replace(tmp_file, new_file)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
 
 
 # If a parameter has >1 line, specify the number of lines here
 _params_with_extra_lines = {17: 2}
 
+# Number of lines for each parameter number, precomputed so that parsing can index it directly. Parameters past the end
+# of this (i.e. run lines) are always one line.
+_nlines_table = tuple(_params_with_extra_lines.get(i, 1) for i in range(64))
+
 
 def _nlines_for_param(param_num):
-    if param_num in _params_with_extra_lines:
-        return _params_with_extra_lines[param_num]
-    else:
-        return 1
+    return _nlines_table[param_num] if param_num < len(_nlines_table) else 1
 
 
 def _mod_i2s_args_parsing(args):
     def check_dict_fmt(dict_in):
-        if any(not isinstance(k, int) for k in dict_in.keys()) or any(k < 1 for k in dict_in.keys()):
-            raise TypeError('The parameter numbers to modify must be specified as positive integers')
-        elif any(not isinstance(v, str) for v in dict_in.values()):
-            raise TypeError('The values to assign to the parameters must be specified as string')
-
+        dict_out = dict()
         for k, v in dict_in.items():
-            dict_in[k] = v.splitlines()
+            if not isinstance(k, int) or k < 1:
+                raise TypeError('The parameter numbers to modify must be specified as positive integers')
+            elif not isinstance(v, str):
+                raise TypeError('The values to assign to the parameters must be specified as string')
+            # Every line boundary splitlines recognizes is non-printable, so most values (single lines) can skip it.
+            # Empty strings still need to give an empty list.
+            dict_out[k] = [v] if v and v.isprintable() else v.splitlines()
 
-        return dict_in
+        return dict_out
 
     if len(args) == 1:
         if isinstance(args[0], dict):
@@ -241,17 +290,21 @@ def _mod_i2s_args_parsing(args):
         raise TypeError('If giving the parameter numbers and parameter values as positional arguments, there must be '
                         'an even number (i.e. a value for every number)')
     else:
-        dict_out = {args[i]: args[i+1] for i in range(0, len(args), 2)}
-        return check_dict_fmt(dict_out)
+        return check_dict_fmt(dict(zip(args[0::2], args[1::2])))
+
+
+# Names of the columns in the run lines of slice and opus I2S input files
+_slice_run_keys = ('year', 'month', 'day', 'run', 'slice')
+_full_run_keys = ('opus_file', 'year', 'month', 'day', 'run', 'lat', 'lon', 'alt', 'Tins', 'Pins', 'Hins',
+                  'Tout', 'Pout', 'Hout', 'SIA', 'FVSI', 'WSPD', 'WDIR')
 
 
 def parse_run_line(line, infile=None):
     line = line.split()
     if len(line) == _run_cols_for_slices:
-        keys = ('year', 'month', 'day', 'run', 'slice')
+        keys = _slice_run_keys
     elif len(line) <= _run_cols_for_full:
-        keys = ('opus_file', 'year', 'month', 'day', 'run', 'lat', 'lon', 'alt', 'Tins', 'Pins', 'Hins',
-                'Tout', 'Pout', 'Hout', 'SIA', 'FVSI', 'WSPD', 'WDIR')
+        keys = _full_run_keys
     elif infile is None:
         raise exceptions.I2SFormatException('The following line had {} columns for the igram list, expected '
                                             'no more than {}:\n{}'
@@ -260,7 +313,49 @@ def parse_run_line(line, infile=None):
         raise exceptions.I2SFormatException('I2S input file ({}) had {} columns for the igram list, expected '
                                             'no more than {}'
                                             .format(infile, len(line), _run_cols_for_full))
-    return {k: v for k, v in zip(keys, line)}
+    return dict(zip(keys, line))
+
+
+def _prefetch_files(paths):
+    """
+    Ask the OS to start reading files into the page cache before they are needed
+
+    This is meant to be called before a loop that reads many files one after another, so that the kernel can fetch
+    them in parallel rather than each read waiting on a cold-cache open. It is only a hint; on systems without
+    :func:`os.posix_fadvise` or for files that cannot be opened it does nothing.
+
+    :param paths: the files that will be read
+    :type paths: iterable of str
+
+    :return: None
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return
+
+    for p in paths:
+        try:
+            fd = os.open(p, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+
+def _read_i2s_file(filename):
+    """
+    Read the full contents of an I2S input file as bytes
+
+    :param filename: the path to the file
+    :type filename: str
+
+    :return: the file contents
+    :rtype: bytes
+    """
+    return Path(filename).read_bytes()
 
 
 def read_i2s_input_params(infile, last_header=_default_last_header_param, verbatim_run_lines=False):
@@ -282,24 +377,77 @@ def read_i2s_input_params(infile, last_header=_default_last_header_param, verbat
     :return: two lists, one of header values and one of run lines. The latter will be dicts or strings, depending on
      ``verbatim_run_lines``.
     """
+    # The parsed file is cached, so build new lists (and run line dicts) each time to keep callers from modifying the
+    # cached copy.
+    header_params, run_lines = _read_i2s_input_params_cached(infile, last_header)
+    header_params = list(header_params)
+    if verbatim_run_lines:
+        run_files = list(run_lines)
+    else:
+        run_files = [parse_run_line(value, infile) for value in run_lines]
+
+    return header_params, run_files
+
+
+def clear_i2s_input_cache():
+    """
+    Forget all I2S input files parsed by :func:`read_i2s_input_params`, so that the next read of each one parses it
+    again.
+
+    :return: None
+    """
+    _i2s_input_cache.clear()
+
+
+# Most recently parsed I2S input files, keyed by absolute path and number of header parameters. The values are the file
+# modification time, size and inode when it was read, used to detect changes, and the header parameters and verbatim
+# run lines as tuples.
+_i2s_input_cache = OrderedDict()
+_i2s_input_cache_size = 32
+
 
+def _i2s_file_state(filename):
+    st = os.stat(filename)
+    return st.st_mtime_ns, st.st_size, st.st_ino
 
-    header_params = []
-    run_files = []
-    with open(infile, 'rb') as robj:
-        for paramnum, partnum, value, comment in iter_i2s_input_params(robj):
-            value = value.strip()
-            if paramnum <= last_header:
-                if len(header_params) < paramnum:
-                    header_params.append(value)
-                else:
-                    header_params[paramnum-1] += '\n'+value
-            elif verbatim_run_lines:
-                run_files.append(value)
+
+def _get_cached_i2s_input_params(infile, last_header):
+    cache_key = (os.path.abspath(infile), last_header)
+    cached = _i2s_input_cache.get(cache_key)
+    if cached is None or cached[0] != _i2s_file_state(infile):
+        return None
+    _i2s_input_cache.move_to_end(cache_key)
+    return cached[1]
+
+
+def _read_i2s_input_params_cached(infile, last_header):
+    parsed = _get_cached_i2s_input_params(infile, last_header)
+    if parsed is not None:
+        return parsed
+
+    file_state = _i2s_file_state(infile)
+    header_parts = []
+    run_lines = []
+    # Read the raw bytes in one go and let the iterator decode them all at once
+    contents = _read_i2s_file(infile)
+    for paramnum, partnum, value, comment in iter_i2s_input_params(contents):
+        value = value.strip()
+        if paramnum <= last_header:
+            # Collect the lines of multi-line parameters and join them at the end
+            if len(header_parts) < paramnum:
+                header_parts.append([value])
             else:
-                run_files.append(parse_run_line(value, infile))
+                header_parts[paramnum-1].append(value)
+        else:
+            run_lines.append(value)
 
-    return header_params, run_files
+    parsed = (tuple('\n'.join(parts) for parts in header_parts), tuple(run_lines))
+    cache_key = (os.path.abspath(infile), last_header)
+    _i2s_input_cache[cache_key] = (file_state, parsed)
+    _i2s_input_cache.move_to_end(cache_key)
+    if len(_i2s_input_cache) > _i2s_input_cache_size:
+        _i2s_input_cache.popitem(last=False)
+    return parsed
 
 
 def slice_line_date(slice_dict):
@@ -321,10 +469,20 @@ def slice_date_subdir(date, run):
 
 
 def i2s_use_slices(infile, last_header=_default_last_header_param):
-    _, igrams = read_i2s_input_params(infile, last_header=last_header)
-    if len(igrams) == 0:
+    # If the file has already been read, use that. Otherwise only the first run line is needed, so stop as soon as we
+    # get to it rather than parsing the whole file
+    parsed = _get_cached_i2s_input_params(infile, last_header)
+    if parsed is not None:
+        run_lines = iter(parsed[1])
+    else:
+        run_lines = (value for paramnum, _, value, _ in iter_i2s_input_params(_read_i2s_file(infile))
+                     if paramnum > last_header)
+
+    first_run_line = next(run_lines, None)
+    if first_run_line is None:
         raise exceptions.I2SFormatException('I2S intput file ({}) has no igrams listed, cannot tell if uses slices or full igrams'.format(infile))
-    n = len(igrams[0])
+
+    n = len(first_run_line.split())
     if n == _run_cols_for_slices:
         return True
     elif n <= _run_cols_for_full:
@@ -339,7 +497,7 @@ def iter_i2s_input_params(fobj, include_all_lines=False):
     """
     Iterate over parameters in an I2S input file
 
-    :param fobj: an open file handle to the input file
+    :param fobj: an open file handle to the input file, or the contents of the file as a string or bytes
 
     :param include_all_lines: whether or not to return each line in the input file. Default is ``False``, which will
      only return lines that are input parameters. ``True``
@@ -349,23 +507,43 @@ def iter_i2s_input_params(fobj, include_all_lines=False):
      ``include_all_lines`` is ``True`` then a boolean indicating whether the line is a parameter is returned as the
      fifth value.
     """
+    # Look up the number of lines per parameter directly in the table, this is needed for every parameter
+    nlines_table = _nlines_table
+    nlines_table_len = len(nlines_table)
     param_num = 1
     subparam_num = 1
-    curr_param_lines = _nlines_for_param(param_num)
-
-    for line in fobj:
-        if isinstance(line, bytes):
-            line = line.decode('utf8', errors='replace')
+    curr_param_lines = nlines_table[param_num]
+
+    # I2S input files are small, so read and decode the whole thing at once rather than line-by-line
+    text = fobj if isinstance(fobj, (str, bytes)) else fobj.read()
+    if isinstance(text, bytes):
+        text = text.decode('utf8', errors='replace')
+
+    # Only split on newlines (not str.splitlines, which also breaks on other control characters), keeping the
+    # newline at the end of each line as iterating over the file did
+    lines = text.split('\n')
+    last_line = lines.pop()
+    lines = [l + '\n' for l in lines]
+    if last_line:
+        lines.append(last_line)
+
+    for line in lines:
         # Anything after a colon is a comment. Lines that contain nothing but white space and/or comments are
         # not parameters, so we split on the colon and check if the part before the colon has any non-whitespace
         # characters. Also do NOT split if the colon is immediately followed by a backslash - this indicates that
-        # it is part of a Windows path (e.g. c:\tccon\documents).
-        line = re.split(r':(?=[^\\])', line, maxsplit=1)
-        value = line[0]
-        if len(line) > 1:
-            comment = ':'.join(line[1:])
-        else:
+        # it is part of a Windows path (e.g. c:\tccon\documents). Most lines have no colon at all or have the comment
+        # colon first, so only fall back on the regex when the first colon might be part of a path.
+        icolon = line.find(':')
+        if icolon < 0:
+            value = line
             comment = ''
+        elif icolon + 1 < len(line) and line[icolon + 1] != '\\':
+            value = line[:icolon]
+            comment = line[icolon + 1:]
+        else:
+            line = _colon_split_re.split(line, maxsplit=1)
+            value = line[0]
+            comment = line[1] if len(line) > 1 else ''
 
         is_param = len(value.strip()) > 0
         if include_all_lines:
@@ -387,15 +565,17 @@ def iter_i2s_input_params(fobj, include_all_lines=False):
             if subparam_num == curr_param_lines:
                 param_num += 1
                 subparam_num = 1
-                curr_param_lines = _nlines_for_param(param_num)
+                curr_param_lines = nlines_table[param_num] if param_num < nlines_table_len else 1
             else:
                 subparam_num += 1
 
 
 def sort_datestr(date_strings):
+    date_search = _date8_re.search
+
     def keyfxn(dstr):
-        dstr = re.search(r'\d{8}', dstr).group()
-        return dt.datetime.strptime(dstr, '%Y%m%d')
+        # YYYYMMDD as an integer sorts the same as the date, no need to build datetimes
+        return int(date_search(dstr).group())
 
     return sorted(date_strings, key=keyfxn)
 
@@ -414,8 +594,7 @@ def iter_target_dirs(cfg, incl_datestr=False):
     :return: iterable of target directory paths (as strings) and (if ``incl_datestr`` is ``True``) site date strings.
     """
     for site in cfg['Sites'].sections:
-        for rvalues in iter_site_target_dirs(cfg['Sites'][site], incl_datestr=incl_datestr):
-            yield rvalues
+        yield from iter_site_target_dirs(cfg['Sites'][site], incl_datestr=incl_datestr)
 
 
 def iter_site_target_dirs(site_sect, incl_datestr=False, to_subdir=True):
@@ -431,9 +610,11 @@ def iter_site_target_dirs(site_sect, incl_datestr=False, to_subdir=True):
     :return: iterable of target directory paths (as strings) and (if ``incl_datestr`` is ``True``) site date strings.
     """
     for sitedate in site_sect.sections:
-        root_dir = get_date_cfg_option(site_sect, sitedate, 'site_root_dir')
+        # We already have the date section, so no need to search for it like get_date_cfg_option does
+        date_sect = site_sect[sitedate]
+        root_dir = _get_date_sect_option(site_sect, date_sect, 'site_root_dir')
         if to_subdir:
-            subdir = get_date_cfg_option(site_sect, sitedate, 'subdir')
+            subdir = _get_date_sect_option(site_sect, date_sect, 'subdir')
             full_dir = os.path.join(root_dir, sitedate, subdir)
         else:
             full_dir = os.path.join(root_dir, sitedate)
@@ -458,8 +639,7 @@ def iter_i2s_dirs(cfg, incl_datestr=False):
     :return: iterable of run directory paths (as strings) and (if ``incl_datestr`` is ``True``) site date strings.
     """
     for site in cfg['Sites'].sections:
-        for rvalues in iter_site_i2s_dirs(site, cfg, incl_datestr=incl_datestr):
-            yield rvalues
+        yield from iter_site_i2s_dirs(site, cfg, incl_datestr=incl_datestr)
 
 
 def iter_site_i2s_dirs(site, cfg, incl_datestr=False):
@@ -475,8 +655,11 @@ def iter_site_i2s_dirs(site, cfg, incl_datestr=False):
 
     :return: iterable of run directory paths (as strings) and (if ``incl_datestr`` is ``True``) site date strings.
     """
-    for sitedate in cfg['Sites'][site].sections:
-        run_dir = date_subdir(cfg, site, sitedate)
+    # Same as date_subdir, but the section names are already the full date keys so there is no need to look them up
+    site_sect = cfg['Sites'][site]
+    site_prefix = os.path.join(cfg['Run']['run_top_dir'], site_sect.name, '')
+    for sitedate in site_sect.sections:
+        run_dir = site_prefix + sitedate
         if incl_datestr:
             yield run_dir, sitedate
         else:
@@ -501,9 +684,14 @@ def load_config_file(cfg_file):
     cfg_file_dir = os.path.abspath(os.path.dirname(cfg_file))
     path_keys = ('run_top_dir', 'site_root_dir', 'flimit_file', 'i2s_input_file')
 
-    def make_paths_abs(section, key):
-        if key in path_keys and not os.path.isabs(section[key]):
-            section[key] = os.path.abspath(os.path.join(cfg_file_dir, section[key]))
+    def make_paths_abs(section):
+        # Only a few keys can be paths, so check for those in each section rather than visiting every option as
+        # cfg.walk would
+        for key in path_keys:
+            if key in section and not os.path.isabs(section[key]):
+                section[key] = os.path.abspath(os.path.join(cfg_file_dir, section[key]))
+        for subsect in section.sections:
+            make_paths_abs(section[subsect])
 
     cfg = ConfigObj(cfg_file, configspec=os.path.join(_etc_dir, 'i2s_in_val.cfg'))
     validator = Validator()
@@ -520,13 +708,15 @@ def load_config_file(cfg_file):
         raise exceptions.ConfigException(final_error_msg)
 
     # Make relative paths relative to the config file
-    cfg.walk(make_paths_abs)
+    make_paths_abs(cfg)
 
     # In the I2S setting section, replace "\\n" and "\\r" with "\n" and "\r" - i.e. undo the
     # backslash escaping the configobj does. This is necessary because some of the i2s parameters
     # need to have two lines.
-    for key, value in cfg['I2S'].items():
-        cfg['I2S'][key] = value.replace('\\n', '\n').replace('\\r', '\r')
+    i2s_sect = cfg['I2S']
+    for key, value in i2s_sect.items():
+        if '\\' in value:
+            i2s_sect[key] = value.replace('\\n', '\n').replace('\\r', '\r')
 
     return cfg
 
@@ -572,13 +762,36 @@ def get_date_cfg_option(site_cfg, datestr, optname):
     :raises exceptions.ConfigExceptions: if the give option isn't found in either the site or date section
     """
     key = _find_site_datekey(site_cfg, datestr)
-    if optname in site_cfg[key] and site_cfg[key][optname] is not None:
-        return site_cfg[key][optname]
-    elif optname in site_cfg:
-        return site_cfg[optname]
+    return _get_date_sect_option(site_cfg, site_cfg[key], optname)
+
+
+def _get_date_sect_option(site_cfg, date_cfg, optname):
+    """
+    Get a config option from a date section, falling back on the general site option if not present
+
+    :param site_cfg: the section of the config for the site
+    :type site_cfg: :class:`configobj.Section`
+
+    :param date_cfg: the date-specific section within ``site_cfg``
+    :type date_cfg: :class:`configobj.Section`
+
+    :param optname: the option key to search for.
+    :type optname: str
+
+    :return: the option value, from the date section if found there, from the site if not.
+    :raises exceptions.ConfigExceptions: if the give option isn't found in either the site or date section
+    """
+    val = date_cfg.get(optname)
+    if val is not None:
+        return val
+
+    # The site value is returned even if it is None, so need a sentinel to tell if it is missing
+    val = site_cfg.get(optname, _missing)
+    if val is not _missing:
+        return val
     else:
         raise exceptions.ConfigException('The option "{}" was not found in the date-specific section ({}) nor the '
-                                         'overall site exception'.format(optname, key))
+                                         'overall site exception'.format(optname, date_cfg.name))
 
 
 def _find_site_datekey(site_cfg, datestr):
@@ -595,13 +808,43 @@ def _find_site_datekey(site_cfg, datestr):
     :return: the key in the ``site_cfg`` for the requested date
     :rtype: str
     """
-    if datestr in site_cfg.keys():
+    # Section.keys() builds a new list each call, so test membership on the section itself
+    if datestr in site_cfg:
         return datestr
+    elif len(datestr) == 8:
+        # The usual case of YYYYMMDD: avoid checking every key in the section by using an index of the keys by
+        # their last 8 characters.
+        key = _site_datekey_index(site_cfg).get(datestr)
+        if key is not None:
+            return key
     else:
-        for k in site_cfg.keys():
+        for k in site_cfg:
             if k.endswith(datestr):
                 return k
-        raise exceptions.SiteDateException('No key matching "{}" found in site "{}"'.format(datestr, site_cfg.name))
+    raise exceptions.SiteDateException('No key matching "{}" found in site "{}"'.format(datestr, site_cfg.name))
+
+
+# Indices of the keys in site config sections by their last 8 characters (i.e. the YYYYMMDD part of the date strings).
+# These are keyed by the ID of the section (sections are dicts, so cannot be hashed) and removed when the section is
+# garbage collected. Each index is stored with the keys it was made from, so that it is rebuilt if the keys are changed
+# in any way (added, removed, renamed, or reordered) or a new section reuses the ID.
+_site_datekey_indices = dict()
+
+
+def _site_datekey_index(site_cfg):
+    cfg_id = id(site_cfg)
+    keys = tuple(site_cfg.keys())
+    index_keys, index = _site_datekey_indices.get(cfg_id, (None, None))
+    if index_keys != keys:
+        index = dict()
+        for k in keys:
+            if len(k) >= 8:
+                # keep the first match, same as searching through the keys in order would
+                index.setdefault(k[-8:], k)
+        if cfg_id not in _site_datekey_indices:
+            weakref.finalize(site_cfg, _site_datekey_indices.pop, cfg_id, None)
+        _site_datekey_indices[cfg_id] = (keys, index)
+    return index
 
 
 def get_ggg_subpath(*dir_parts, gggpath=None):
@@ -610,6 +853,10 @@ def get_ggg_subpath(*dir_parts, gggpath=None):
     return os.path.join(gggpath, *dir_parts)
 
 
+def _has_glob_magic(s):
+    return any(c in s for c in '*?[')
+
+
 def find_by_glob(pattern: str) -> str:
     """
     Find exactly one file matching a pattern.
@@ -618,7 +865,21 @@ def find_by_glob(pattern: str) -> str:
     :return: the path to the matching file, if found
     :raises IOError: if 0 or 2+ files found.
     """
-    files = glob(pattern)
+    head, tail = os.path.split(pattern)
+    if not _has_glob_magic(head) and _has_glob_magic(tail):
+        # Only the file name has wildcards, so a single directory listing is enough. Like glob, hidden files only
+        # match if the pattern itself starts with a dot, a missing directory just means no matches, and case sensitivity
+        # follows the platform.
+        incl_hidden = tail.startswith('.')
+        try:
+            with os.scandir(head or os.curdir) as entries:
+                files = [os.path.join(head, e.name) for e in entries
+                         if (incl_hidden or not e.name.startswith('.')) and fnmatch.fnmatch(e.name, tail)]
+        except OSError:
+            files = []
+    else:
+        files = glob(pattern)
+
     if len(files) == 1:
         return files[0]
     else:
@@ -628,37 +889,51 @@ def find_by_glob(pattern: str) -> str:
 def change_ggg_file(gggfile, backup=False, aks='no', spts='no'):
     # Get the window from the file name, needed for the ak/spt subdirectories
     gggbname = os.path.basename(gggfile)
-    window = re.search(r'^[a-z]+_\d+', gggbname).group()
+    window = _ggg_window_re.search(gggbname).group()
 
     save_aks = aks != 'no'
     save_spts = spts != 'no'
 
-    with open(gggfile, 'r') as robj:
-        ggglines = robj.readlines()
-
-    for iline, line in enumerate(ggglines):
-        if '{sep}ak{sep}'.format(sep=os.sep) in line and aks != 'gggpath':
-            end = '\n'  # TODO: figure out how to turn on saving AKs
-            ggglines[iline] = os.path.join('.', 'ak', window, 'k') + end
-        elif '{sep}spt{sep}'.format(sep=os.sep) in line and spts != 'gggpath':
-            # putting a 0 at the end of the line tells it to save no spectral fits.
-            end = '\n' if save_spts else ' 0 \n'
-            ggglines[iline] = os.path.join('.', 'spt', window, 'z') + end
-
     if backup:
         shutil.copy2(gggfile, gggfile+'.orig')
 
-    with open(gggfile, 'w') as wobj:
-        wobj.writelines(ggglines)
+    # If both the AK and spectral fit paths are to be left pointing to GGGPATH, there's nothing to change
+    if aks != 'gggpath' or spts != 'gggpath':
+        ak_token = '{sep}ak{sep}'.format(sep=os.sep)
+        spt_token = '{sep}spt{sep}'.format(sep=os.sep)
+        ak_line = os.path.join('.', 'ak', window, 'k') + '\n'  # TODO: figure out how to turn on saving AKs
+        # putting a 0 at the end of the line tells it to save no spectral fits.
+        spt_line = os.path.join('.', 'spt', window, 'z') + ('\n' if save_spts else ' 0 \n')
+
+        # Stream the changed lines into a new file and only replace the original if something changed
+        tmp_file = gggfile + '.tmp'
+        modified = False
+        try:
+            with open(gggfile, 'r') as robj, open(tmp_file, 'w') as wobj:
+                for line in robj:
+                    if ak_token in line and aks != 'gggpath':
+                        new_line = ak_line
+                    elif spt_token in line and spts != 'gggpath':
+                        new_line = spt_line
+                    else:
+                        new_line = line
+                    modified = modified or new_line != line
+                    wobj.write(new_line)
+
+            if modified:
+                shutil.copymode(gggfile, tmp_file)
+                os.replace(tmp_file, gggfile)
+        finally:
+            # Either nothing changed or something went wrong, in both cases the original file stays as it was
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
 
     # Make the "ak" and "spt" subdirs just in case gfit will stop if they are missing
     run_dir = os.path.dirname(gggfile)
-    ak_dir = os.path.join(run_dir, 'ak', window)
-    if aks != 'gggpath' and not os.path.exists(ak_dir):
-        os.makedirs(ak_dir)
-    spt_dir = os.path.join(run_dir, 'spt', window)
-    if spts != 'gggpath' and not os.path.exists(spt_dir):
-        os.makedirs(spt_dir)
+    if aks != 'gggpath':
+        os.makedirs(os.path.join(run_dir, 'ak', window), exist_ok=True)
+    if spts != 'gggpath':
+        os.makedirs(os.path.join(run_dir, 'spt', window), exist_ok=True)
 
 
 def get_num_header_lines(filename):
@@ -674,8 +949,17 @@ def get_num_header_lines(filename):
     :return: the number of header lines
     :rtype: int
     """
-    with open(filename, 'r') as fobj:
-        header_info = fobj.readline()
+    # Only the first line is needed and it is always short, so skip the buffered text IO layer and just read the first
+    # few bytes of the file.
+    fd = os.open(filename, os.O_RDONLY)
+    try:
+        raw = os.read(fd, 256)
+    finally:
+        os.close(fd)
+    nl = raw.find(b'\n')
+    if nl >= 0:
+        raw = raw[:nl]
+    header_info = raw.decode('ascii', 'replace')
 
     if ',' in header_info:
         header = header_info.split(',')
@@ -1,15 +1,23 @@
+from collections import OrderedDict
 from datetime import timedelta as tdel
-from glob import glob
+from functools import partial
+import json
+from multiprocessing import Pool
 import numpy as np
 import pandas as pd
 import os
 import re
-from scipy import stats
 
 from typing import Sequence, Union
 
-from .runutils import find_by_glob, get_num_header_lines, ProgressBar
-from .readers import read_eng_file
+try:
+    import pyarrow
+    from pyarrow import feather, ipc
+except ImportError:
+    feather = None
+
+from .runutils import find_by_glob, get_num_header_lines
+from .readers import read_eng_file, select_eof_columns
 from .exceptions import TimeMatchError
 
 
@@ -43,13 +51,24 @@ _abbrev_to_subdir = {'ae': 'Ascension',
 
 all_sites = tuple(_abbrev_to_subdir.keys())
 
+# Patterns to get the specie and "_old"/"_new" suffix from X-quantity names, e.g. "xco2_ppm_old"
+_xspecie_re = re.compile('(?<=x)[A-Za-z0-9]+')
+_old_new_suffix_re = re.compile('_(old|new)$')
+# calc_delta_x accepts the "_old"/"_new" anywhere in the name
+_old_new_re = re.compile('_(old|new)')
+
+# GGG2014 "air"/"xair" as a whole part of an underscore-separated column name, e.g. "column_air" or "xair_error"
+_air_name_re = re.compile('(^|_)(x?)air(?=_|$)')
+
 
 def is_outlier(y, zcut=2):
-    xx = stats.zscore(np.abs(y)) < zcut
+    # z-score of the absolute values, same as scipy.stats.zscore (population standard deviation) in one numpy pass
+    absy = np.abs(np.asarray(y, dtype=np.float64))
+    xx = (absy - absy.mean()) / absy.std() < zcut
     return ~xx
 
 
-def read_eng_file_by_sitedate(sitedate: str) -> pd.DataFrame:
+def read_eng_file_by_sitedate(sitedate: str, usecols: Sequence[str] = None) -> pd.DataFrame:
     """
     Read the .eof.csv file for a particular site and OCO-2 target date
 
@@ -57,6 +76,8 @@ def read_eng_file_by_sitedate(sitedate: str) -> pd.DataFrame:
      month, and day. Example: "ci20140901" would look for an .eof.csv file uploaded for Caltech measurements on
      2014-09-01. This function uses the ``_root_dir`` and the ``_abbrev_to_subdir`` dictionary defined in the module to
      find these files. Right now, this is only set up for ccycle.
+    :param usecols: columns to read from the .eof.csv file, see :func:`~gggutils.readers.read_eng_file`. If not given,
+     all columns are read.
     :return: a dataframe with all the information from the .eof.csv file, indexed with the dates of the measurments in
      the file.
     """
@@ -64,16 +85,41 @@ def read_eng_file_by_sitedate(sitedate: str) -> pd.DataFrame:
     if not os.path.exists(date_dir):
         raise IOError('No directory found for {} (looking for {})'.format(sitedate, date_dir))
 
-    eof_csv_files = glob(os.path.join(date_dir, '*.eof.csv'))
+    return _read_date_dir_eof(date_dir, _list_eof_csv_files(date_dir), usecols=usecols)
+
+
+def _list_eof_csv_files(date_dir: str) -> list:
+    with os.scandir(date_dir) as entries:
+        return [e.path for e in entries if e.name.endswith('.eof.csv')]
+
+
+def _scan_site_eofs(site_dir: str, site_abbrev: str) -> OrderedDict:
+    # One pass over the site directory and each date directory, rather than globbing the date directories and then
+    # globbing each of them again for every use of the .eof.csv paths.
+    site_eofs = OrderedDict()
+    with os.scandir(site_dir) as entries:
+        for entry in entries:
+            if entry.name.startswith(site_abbrev) and entry.is_dir():
+                site_eofs[entry.name] = _list_eof_csv_files(entry.path)
+    return site_eofs
+
+
+def _read_date_dir_eof(date_dir: str, eof_csv_files: Sequence[str], usecols: Sequence[str] = None) -> pd.DataFrame:
     if len(eof_csv_files) == 1:
-        return read_eng_file(eof_csv_files[0])
+        return read_eng_file(eof_csv_files[0], usecols=usecols)
     elif len(eof_csv_files) == 0:
         raise IOError('No .eof.csv file found in {}'.format(date_dir))
     else:
         raise IOError('Multiple .eof.csv files found in {}'.format(date_dir))
 
 
-def read_all_eofs_for_site(site_abbrev: str) -> pd.DataFrame:
+def _read_scanned_date_dir_eof(date_dir_and_files: tuple, usecols: Sequence[str] = None) -> pd.DataFrame:
+    # Takes one item of the _scan_site_eofs dict so that it can be mapped over
+    return _read_date_dir_eof(*date_dir_and_files, usecols=usecols)
+
+
+def read_all_eofs_for_site(site_abbrev: str, cache: bool = False, nprocs: int = 1,
+                           usecols: Sequence[str] = None) -> pd.DataFrame:
     """
     Read all delivered .eof.csv files for a given site.
 
@@ -82,17 +128,103 @@ def read_all_eofs_for_site(site_abbrev: str) -> pd.DataFrame:
     files. Right now, this is only set up for ccycle.
 
     :param site_abbrev: the two-letter abbreviation of the site to load .eof.csv files for.
+    :param cache: if ``True``, the concatenated dataframe is saved to a hidden, uncompressed Feather file
+     (:file:`.<site_abbrev>_all_eofs.feather`) in the site directory and later calls read that instead (through a
+     memory map), as long as none of the date directories or .eof.csv files have been added, removed, or changed (in
+     modification time or size) since. Requires pyarrow and write permission in the site directory.
+    :param nprocs: number of processes to use to read the .eof.csv files. The default of 1 reads them serially.
+    :param usecols: columns to read from the .eof.csv files, see :func:`~gggutils.readers.read_eng_file`. If not given,
+     all columns are read. The cache always stores all the columns, so that it can be used whatever columns are
+     requested.
     :return: a dataframe with all the information from the .eof.csv file, indexed with the dates of the measurments in
      the file.
     """
-    date_dirs = glob(os.path.join(_root_dir, _abbrev_to_subdir[site_abbrev], '{}*'.format(site_abbrev)))
-    date_dirs = [os.path.basename(d) for d in date_dirs]
-    indiv_dfs = []
-    for ddir in date_dirs:
-        indiv_dfs.append(read_eng_file_by_sitedate(ddir))
+    site_dir = os.path.join(_root_dir, _abbrev_to_subdir[site_abbrev])
+    site_eofs = _scan_site_eofs(site_dir, site_abbrev)
+    date_dirs = list(site_eofs.keys())
+
+    if cache and feather is None:
+        raise ImportError('Caching the .eof.csv data requires pyarrow to be installed in this environment')
+
+    # Hidden so that it cannot be mistaken for a date directory
+    cache_file = os.path.join(site_dir, '.{}_all_eofs.feather'.format(site_abbrev))
+    # Get the state of the files before reading them, so that any that change while being read make the cache stale
+    source_state = _eof_source_state(site_dir, site_eofs) if cache else None
+    if cache and _is_cache_current(cache_file, source_state):
+        print('Read .eof.csvs for {} from {}'.format(site_abbrev, cache_file))
+        return _read_eof_cache(cache_file, usecols=usecols)
+
+    read_fxn = partial(_read_scanned_date_dir_eof, usecols=None if cache else usecols)
+    date_dirs_and_files = [(os.path.join(site_dir, ddir), files) for ddir, files in site_eofs.items()]
+    if nprocs <= 1:
+        indiv_dfs = [read_fxn(item) for item in date_dirs_and_files]
+    else:
+        # Each file is independent, so they can be parsed in parallel. map keeps them in order.
+        with Pool(processes=nprocs) as pool:
+            indiv_dfs = pool.map(read_fxn, date_dirs_and_files)
 
     print('Read .eof.csvs from {}'.format(','.join(date_dirs)))
-    return pd.concat(indiv_dfs, sort=False)
+    df = pd.concat(indiv_dfs, sort=False)
+    if cache:
+        _write_eof_cache(cache_file, df, source_state)
+        if usecols is not None:
+            df = df.loc[:, select_eof_columns(df.columns, usecols)]
+    return df
+
+
+def _write_eof_cache(cache_file: str, df: pd.DataFrame, source_state: str):
+    # Feather can only store a default index, so the dates go in a column. Leaving the file uncompressed means it can
+    # be memory mapped when read back. The state of the files it was made from goes in the schema metadata.
+    table = pyarrow.Table.from_pandas(df.reset_index(names='_date_index'), preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[_eof_cache_state_key] = source_state.encode()
+    feather.write_feather(table.replace_schema_metadata(metadata), cache_file, compression='uncompressed')
+
+
+def _read_eof_cache(cache_file: str, usecols: Sequence[str] = None) -> pd.DataFrame:
+    table = feather.read_table(cache_file, memory_map=True)
+    if usecols is not None:
+        # Selecting from the mapped table is free, so only the requested columns get converted for pandas
+        table = table.select(['_date_index'] + select_eof_columns(table.column_names[1:], usecols))
+    df = table.to_pandas()
+    df = df.set_index('_date_index')
+    df.index.name = None
+    return df
+
+
+# Schema metadata key in the .eof.csv cache files that records the state of the files the cache was made from
+_eof_cache_state_key = b'gggutils_source_state'
+
+
+def _eof_source_state(site_dir: str, site_eofs: dict) -> str:
+    # The modification time and size of each date directory (which change if files are added or removed) and each
+    # .eof.csv file. Both are needed, since a file copied with its modification time preserved can have an older time
+    # than the cache. The site directory is left out since writing the cache changes it.
+    state = dict()
+    for ddir, files in site_eofs.items():
+        for path in [os.path.join(site_dir, ddir)] + list(files):
+            st = os.stat(path)
+            state[os.path.relpath(path, site_dir)] = [st.st_mtime_ns, st.st_size]
+    return json.dumps(state, sort_keys=True)
+
+
+def _is_cache_current(cache_file: str, source_state: str) -> bool:
+    # The cache is only current if the date directories and .eof.csv files are exactly as they were when it was made
+    if not os.path.exists(cache_file):
+        return False
+    with pyarrow.memory_map(cache_file) as source:
+        metadata = ipc.open_file(source).schema.metadata or {}
+    return metadata.get(_eof_cache_state_key) == source_state.encode()
+
+
+def _air_to_luft_names(columns: Sequence[str]) -> dict:
+    # Only returns the columns that need renamed, so that pandas only has to look those up
+    renames = dict()
+    for c in columns:
+        new_c = _air_name_re.sub(r'\1\2luft', c)
+        if new_c != c:
+            renames[c] = new_c
+    return renames
 
 
 def search_df_keys(df: pd.DataFrame, pattern: str, nocase: bool = True) -> Sequence[str]:
@@ -104,12 +236,8 @@ def search_df_keys(df: pd.DataFrame, pattern: str, nocase: bool = True) -> Seque
     :param nocase: when ``True``, the search is case-insensitive. Set this to ``False`` to retain case-sensitivity.
     :return: a list of keys matching the requested pattern.
     """
-    re_flags = 0
-    if nocase:
-        re_flags |= re.IGNORECASE
-    matches = [k for k in df.keys() if re.search(pattern, k, flags=re_flags)]
-
-    return matches
+    mask = df.columns.str.contains(pattern, case=not nocase, regex=True)
+    return df.columns[mask].tolist()
 
 
 _def_req_cols = ('flag', 'date', 'year', 'day', 'hour', 'column_o2', 'xluft', 'column_luft', 'xco2_ppm', 'column_co2')
@@ -117,7 +245,7 @@ _def_req_cols = ('flag', 'date', 'year', 'day', 'hour', 'column_o2', 'xluft', 'c
 
 def match_test_to_delivered_data(site_abbrev: str, new_eof_csv_file: str, req_columns: Sequence[str] = _def_req_cols,
                                  max_timedelta: Union[tdel, pd.Timedelta] = pd.Timedelta(seconds=3),
-                                 do_qual_filter: str = 'none') -> pd.DataFrame:
+                                 do_qual_filter: str = 'none', cache: bool = False, nprocs: int = 1) -> pd.DataFrame:
     """
     Create a single dataframe containing data from both old (delivered) .eof.csv files and a new .eof.csv file
 
@@ -137,67 +265,59 @@ def match_test_to_delivered_data(site_abbrev: str, new_eof_csv_file: str, req_co
     :param do_qual_filter: whether or not to quality filter the final dataframe. "none" does no filtering, "old"
      requires that the quality flag in the old data be 0, "new" likewise checks the new quality flag, and "both"
      requires both old and new data to have a quality flag of 0.
+    :param cache: whether to cache the delivered .eof.csv data for the site, see :func:`read_all_eofs_for_site`.
+    :param nprocs: number of processes to use to read the delivered .eof.csv files, see :func:`read_all_eofs_for_site`.
     :return: a combined dataframe that has both old and new data. Column names will be suffixed with "_old" and "_new",
      respectively. Only the columns specified by ``req_columns`` will be included.
     """
-    new_df = read_eng_file(new_eof_csv_file)
-    old_df = read_all_eofs_for_site(site_abbrev)
-
-    # Not sure if there's a faster way to do this other than iterating through every single line and finding the
-    # matching time
-    old_inds = []
-    new_inds = []
-    new_unmatched = 0
-
-    pbar = ProgressBar(new_df.shape[0], style='counter', prefix='Matching')
-    for iline, new_time in enumerate(new_df.index):
-        if iline % 10 == 0 or iline == (new_df.shape[0] - 1):
-            pbar.print_bar(iline)
-
-        timediffs = abs(old_df.index - new_time)
-        old_ind = np.flatnonzero(timediffs < max_timedelta)
-
-        if old_ind.size > 1:
-            # Matched multiple times. Not good. Should only match one.
-            raise TimeMatchError(
-                '{} times matched for {} in the old data. Try reducing the max_timedelta.'.format(old_ind.size,
-                                                                                                  new_time))
-        elif old_ind.size < 1:
-            # No match. Do not include this line from the new data frame
-            new_unmatched += 1
-        else:
-            # Matched.
-            old_ind = old_ind.item()
-            old_inds.append(old_df.index[old_ind])
-            new_inds.append(new_time)
-
-    pbar.finish()
-
-    # Cut down the dataframes to the same lines, reindex them to use just an integer index, but keep the times so we can
-    # check. Cut them down to the desired columns, rename 'xair' and 'air' in the old dataframe to "xluft" and "luft",
-    # respectively.
-    old_columns = [c.replace('air', 'luft') for c in old_df.columns]
-    old_df.columns = old_columns
-
-    old_df = old_df.loc[old_inds, :].reset_index().rename(columns={'index': 'date'})
-    new_df = new_df.loc[old_inds, :].reset_index().rename(columns={'index': 'date'})
-
-    if req_columns != 'all':
-        # If there was a limit placed on the columns, cut down the dataframes to just those columns
-        missing = [c for c in req_columns if c not in old_df.columns]
-        if len(missing) > 0:
-            raise KeyError('The following columns were missing from the old data frame: {}'.format(', '.join(missing)))
-        old_df = old_df.loc[:, req_columns]
-
-        missing = [c for c in req_columns if c not in new_df.columns]
-        if len(missing) > 0:
-            raise KeyError('The following columns were missing from the new data frame: {}'.format(', '.join(missing)))
-        new_df = new_df.loc[:, req_columns]
+    # Only parse the columns that will be kept. The delivered files may be from GGG2014, so ask for the "air" versions
+    # of any "luft" columns too; names not in a file are just skipped.
+    if req_columns == 'all':
+        new_usecols = old_usecols = None
+    else:
+        new_usecols = req_columns
+        old_usecols = set(req_columns).union(c.replace('luft', 'air') for c in req_columns)
+    new_df = read_eng_file(new_eof_csv_file, usecols=new_usecols)
+    old_df = read_all_eofs_for_site(site_abbrev, cache=cache, nprocs=nprocs, usecols=old_usecols)
+
+    # Find the old observation within max_timedelta of each new one. Sorting the old times lets the window around
+    # every new time be found with a binary search, rather than comparing each new time against all the old ones.
+    # The old data is concatenated from many files, so isn't necessarily in time order.
+    old_times = np.asarray(old_df.index, dtype='datetime64[ns]').view('i8')
+    new_times = np.asarray(new_df.index, dtype='datetime64[ns]').view('i8')
+    max_dt = pd.Timedelta(max_timedelta).value
+    old_order = np.argsort(old_times, kind='stable')
+    old_times = old_times[old_order]
+
+    # The old times strictly within max_timedelta of each new time are those from istart up to (not including) iend
+    istart = np.searchsorted(old_times, new_times - max_dt, side='right')
+    iend = np.searchsorted(old_times, new_times + max_dt, side='left')
+    nmatches = iend - istart
+
+    multi_matches = np.flatnonzero(nmatches > 1)
+    if multi_matches.size > 0:
+        # Matched multiple times. Not good. Should only match one.
+        imulti = multi_matches[0]
+        raise TimeMatchError(
+            '{} times matched for {} in the old data. Try reducing the max_timedelta.'.format(nmatches[imulti],
+                                                                                              new_df.index[imulti]))
+
+    # Lines in the new data without a match are not included
+    new_inds = np.flatnonzero(nmatches == 1)
+    old_inds = old_order[istart[new_inds]]
+
+    # Rename 'xair' and 'air' in the old dataframe to "xluft" and "luft", respectively. Then cut down the dataframes to
+    # the desired columns and the matched lines, reindexing them to use just an integer index, but keep the times so we
+    # can check.
+    old_df.rename(columns=_air_to_luft_names(old_df.columns), inplace=True)
+    old_df = _take_matched_rows(old_df, old_inds, req_columns, 'old')
+    new_df = _take_matched_rows(new_df, new_inds, req_columns, 'new')
 
     # can't just use the suffix keywords of join b/c that only affects overlapping columns
     old_df.columns = [k + '_old' for k in old_df.columns]
     new_df.columns = [k + '_new' for k in new_df.columns]
-    combo_df = old_df.join(new_df, how='inner')
+    # Both have the same integer index after taking the matched rows, so the columns can just be put side by side
+    combo_df = pd.concat([old_df, new_df], axis=1)
     combo_df['site'] = site_abbrev
 
     if do_qual_filter == 'none':
@@ -214,6 +334,21 @@ def match_test_to_delivered_data(site_abbrev: str, new_eof_csv_file: str, req_co
     return combo_df.loc[xx, :]
 
 
+def _take_matched_rows(df: pd.DataFrame, inds: np.ndarray, req_columns: Union[str, Sequence[str]], which: str) -> pd.DataFrame:
+    if req_columns != 'all':
+        # If there was a limit placed on the columns, cut down the dataframe to just those columns before taking the
+        # matched rows, so that only those columns get copied. "date" comes from the index, so is added after.
+        missing = [c for c in req_columns if c != 'date' and c not in df.columns]
+        if len(missing) > 0:
+            raise KeyError('The following columns were missing from the {} data frame: {}'.format(which, ', '.join(missing)))
+        df = df.loc[:, [c for c in req_columns if c != 'date']]
+
+    df = df.iloc[inds, :].reset_index().rename(columns={'index': 'date'})
+    if req_columns != 'all':
+        df = df.loc[:, list(req_columns)]
+    return df
+
+
 def match_test_to_delivered_by_site(site_abbrev: str, test_root_dir: str = _default_test_root_dir, **kwargs) -> pd.DataFrame:
     """
     Automatically match old and new data for a specific site.
@@ -239,7 +374,7 @@ def match_test_to_delivered_multi_site(site_abbrevs: Sequence[str], test_root_di
     :param kwargs: keyword arguments for :func:`match_test_to_delivered_data`
     :return: a dataframe of all sites concatentated together
     """
-    total_df = None
+    site_dfs = []
     for site in site_abbrevs:
         try:
             df = match_test_to_delivered_by_site(site, test_root_dir=test_root_dir, **kwargs)
@@ -247,12 +382,10 @@ def match_test_to_delivered_multi_site(site_abbrevs: Sequence[str], test_root_di
             print('Skipping {}: {}'.format(site, err))
             continue
 
-        if total_df is None:
-            total_df = df
-        else:
-            total_df = pd.concat([total_df, df])
+        site_dfs.append(df)
 
-    return total_df
+    # Concatenating once at the end avoids copying the growing dataframe for every site
+    return pd.concat(site_dfs) if len(site_dfs) > 0 else None
 
 
 def recalc_x(df: pd.DataFrame, xname: str, scale: float) -> pd.Series:
@@ -269,8 +402,8 @@ def recalc_x(df: pd.DataFrame, xname: str, scale: float) -> pd.Series:
     :param scale: a final scale factor to put the X-quantity in the right units.
     :return: the series of X-quantity values.
     """
-    specie = re.search('(?<=x)[A-Za-z0-9]+', xname).group()
-    old_or_new = re.search('_(old|new)$', xname)
+    specie = _xspecie_re.search(xname).group()
+    old_or_new = _old_new_suffix_re.search(xname)
     if old_or_new is None:
         old_or_new = ''
     else:
@@ -290,13 +423,14 @@ def read_adcf_file(adcf_file: str) -> pd.DataFrame:
     :param adcf_file: the path to the ADCF file
     :return: a dataframe of the airmass corrections, indexed by date.
     """
-    def _make_timestamp(ser):
-        return pd.Timestamp(int(ser.year), 1, 1) + pd.Timedelta(days=ser.doy - 1)
-
     nhead = get_num_header_lines(adcf_file)
     df = pd.read_csv(adcf_file, header=nhead-1, sep='\s+')
     df['adcf'] = compute_adcf(df, remove_outliers=False)
-    return df.set_index(df.apply(_make_timestamp, axis=1))
+
+    # Build all the dates at once rather than a timestamp per row
+    year_start = (np.asarray(df.year).astype(np.int64) - 1970).astype('datetime64[Y]').astype('datetime64[ns]')
+    dates = pd.DatetimeIndex(year_start) + pd.to_timedelta(np.asarray(df.doy, dtype=np.float64) - 1, unit='D')
+    return df.set_index(dates)
 
 
 def iter_adcf_files(sites: Sequence[str], gas: str, ignore_missing: bool = False,
@@ -351,23 +485,20 @@ def load_all_adcfs(sites: Sequence[str], gas: str, ignore_missing: bool = True,
      a day doesn't have enough spectra on either side of solar noon, then the ADCF will not be reliable.
     :return: a dataframe containing the ADCF data.
     """
-    total_df = None
+    site_dfs = []
     for site, site_df in iter_adcf_files(sites, gas, ignore_missing=ignore_missing):
         if req_num_spectra > 0:
             # Read the .eof.csv file to get the number of spectra per day that are good
             eof_df = read_eng_file(find_by_glob(os.path.join(test_root_dir, site, 'postproc', '*.eof.csv')))
-            xx_dates = pd.Series(False, index=site_df.index)
-            for date in site_df.index:
-                xx_eof = (eof_df.year == date.year) & (eof_df.day == date.dayofyear)
-                xx_dates[date] = (eof_df[xx_eof].flag == 0).sum() > req_num_spectra
-            site_df = site_df[xx_dates]
+            # Count the good spectra for every day in one pass, rather than searching the whole file for each date
+            good_counts = eof_df.loc[eof_df.flag == 0, ['year', 'day']].groupby(['year', 'day']).size().to_dict()
+            xx_dates = [good_counts.get(yd, 0) > req_num_spectra
+                        for yd in zip(site_df.index.year, site_df.index.dayofyear)]
+            site_df = site_df[np.array(xx_dates, dtype=bool)]
         site_df['site'] = site
-        if total_df is None:
-            total_df = site_df
-        else:
-            total_df = pd.concat([total_df, site_df])
+        site_dfs.append(site_df)
 
-    return total_df
+    return pd.concat(site_dfs) if len(site_dfs) > 0 else None
 
 
 def calc_delta_x(df: pd.DataFrame, xquantity: str, recalc_raw: bool = False, recalc_scale: float = 1.0,
@@ -390,7 +521,7 @@ def calc_delta_x(df: pd.DataFrame, xquantity: str, recalc_raw: bool = False, rec
     :return: a new dataframe with the x-quantity, delta x-quantity, hours from local noon, and solar zenith angle. "_old"
      and "_new" suffixes are removed.
     """
-    old_or_new = re.search(r'_(old|new)', xquantity)
+    old_or_new = _old_new_re.search(xquantity)
     if old_or_new is None:
         old_or_new = ''
     else:
@@ -447,69 +578,76 @@ def add_fpit_pres(matched_eofs: pd.DataFrame, interp_method: str = 'index', mod_
     except ImportError:
         raise ImportError('Sorry, this function requires that ginput be installed in this environment')
 
-    with pd.option_context('mode.chained_assignment', None):
-        if mod_dir is None:
-            mod_dir = os.path.join(os.path.expandvars('$GGGPATH'), 'models', 'gnd')
-
-        def round_to_3h(ts, nexthr=False):
-            hr = ts.hour // 3 * 3
-            ts = pd.Timestamp(ts.year, ts.month, ts.day, hr)
-            if nexthr:
-                ts += pd.Timedelta(hours=3)
-            return ts
-
-        lon_key = 'long_deg' + suffix
-        lat_key = 'lat_deg' + suffix
-        date_key = 'date' + suffix
-        year_key = 'year' + suffix
-        day_key = 'day' + suffix
-
-        matched_eofs = matched_eofs.reset_index(drop=True)
-        matched_eofs['fpit_surfp'] = np.nan
-        mod_df = pd.DataFrame(columns=['site', 'psurf', 'pbottom', 'mod_file'])
-        sites_listed = set()
-        for (site, year, doy), sub_df in matched_eofs.groupby(['site', year_key, day_key]):
-            if site not in sites_listed:
-                print('On', site)
-                sites_listed.add(site)
-            # get the site lat and lon. there must be one unique value, or .item() will raise a
-            # ValueError
-            site_lon = sub_df[lon_key].unique().item()
-            site_lat = sub_df[lat_key].unique().item()
-
-            # We'll need to do a little work on the dataframe. We need to keep the integer index so
-            # that we can put the values back in the main dataframe, but we need the actual index to
-            # be the date so that we can insert the geos surface pressure by date and interpolate
-            sub_df['rownum'] = sub_df.index
-            sub_df = sub_df.set_index(date_key, drop=False)
-
-            # load the surface pressures for the relevant times
-            first_geos_time = round_to_3h(sub_df[date_key].min())
-            last_geos_time = round_to_3h(sub_df[date_key].max(), nexthr=True)
-            geos_times = pd.date_range(first_geos_time, last_geos_time, freq='3H')
-
-            for geos_time in geos_times:
+    if mod_dir is None:
+        mod_dir = os.path.join(os.path.expandvars('$GGGPATH'), 'models', 'gnd')
+
+    lon_key = 'long_deg' + suffix
+    lat_key = 'lat_deg' + suffix
+    date_key = 'date' + suffix
+    year_key = 'year' + suffix
+    day_key = 'day' + suffix
+
+    matched_eofs = matched_eofs.reset_index(drop=True)
+    matched_eofs['fpit_surfp'] = np.nan
+    # Rows for the .mod file dataframe, built once all are read so it does not get copied for every GEOS time
+    mod_rows = []
+    mod_times = []
+    # Adjacent days at a site share the .mod files around midnight, so keep the ones already read
+    mod_cache = dict()
+    sites_listed = set()
+    for (site, year, doy), sub_df in matched_eofs.groupby(['site', year_key, day_key]):
+        if site not in sites_listed:
+            print('On', site)
+            sites_listed.add(site)
+        # get the site lat and lon. there must be one unique value, or .item() will raise a
+        # ValueError
+        site_lon = sub_df[lon_key].unique().item()
+        site_lat = sub_df[lat_key].unique().item()
+
+        # The surface pressure is interpolated in a series indexed by date: the observation times come first (with
+        # no pressure yet) and the GEOS times are added after, so that the first rows can go straight back to the
+        # observations' rows in the main dataframe. A GEOS time equal to an observation time just fills in that row.
+        surfp = pd.Series(np.nan, index=pd.DatetimeIndex(sub_df[date_key]))
+        nobs = surfp.size
+
+        # load the surface pressures for the relevant times
+        first_geos_time, last_geos_time = _floor_to_3h([sub_df[date_key].min(), sub_df[date_key].max()])
+        last_geos_time += np.timedelta64(3, 'h')
+        geos_times = pd.date_range(first_geos_time, last_geos_time, freq='3h')
+
+        for geos_time in geos_times:
+            mod_key = (geos_time, site_lat, site_lon)
+            if mod_key not in mod_cache:
                 mod_file_name = mod_utils.mod_file_name_for_priors(geos_time, site_lat, site_lon)
                 mod_file_name = os.path.join(mod_dir, mod_file_name)
-                mod_data = readers.read_mod_file(mod_file_name)
-                sub_df.loc[geos_time, 'fpit_surfp'] = mod_data['scalar']['Pressure']
-
-                this_mod_dict = {'site': site, 'year': year, 'day': doy, 'psurf': mod_data['scalar']['Pressure'],
-                                 'pbottom': mod_data['profile']['Pressure'][0], 'mod_file': mod_file_name}
-                mod_df = pd.concat([mod_df, pd.DataFrame(this_mod_dict, index=[geos_time])], sort=True)
-
-            sub_df['fpit_surfp'] = sub_df.fpit_surfp.sort_index().interpolate(method=interp_method)
-            # Now that we've filled in the FPIT surface pressure, we need to get it back into the main dataframe.
-            # We'll first remove rows that do not have a row number, because they were not in the original dataframe,
-            # then turn those back into a integer index and use that to determine which rows the fpit pressures go in
-            xx_orig = ~pd.isnull(sub_df.rownum)
-            orig_rows = pd.Int64Index(sub_df[xx_orig].rownum)
-            sub_df = sub_df[xx_orig].set_index(orig_rows)
-            matched_eofs.loc[orig_rows, 'fpit_surfp'] = sub_df.fpit_surfp
+                mod_cache[mod_key] = (mod_file_name, readers.read_mod_file(mod_file_name))
+            mod_file_name, mod_data = mod_cache[mod_key]
+            surfp.loc[geos_time] = mod_data['scalar']['Pressure']
+
+            this_mod_dict = {'site': site, 'year': year, 'day': doy, 'psurf': mod_data['scalar']['Pressure'],
+                             'pbottom': mod_data['profile']['Pressure'][0], 'mod_file': mod_file_name}
+            mod_rows.append(this_mod_dict)
+            mod_times.append(geos_time)
+
+        # Interpolate in time order, then put the values back in the original order to pick out the observations
+        time_order = np.argsort(surfp.index.to_numpy(), kind='stable')
+        interp_surfp = np.empty(surfp.size)
+        interp_surfp[time_order] = surfp.iloc[time_order].interpolate(method=interp_method).to_numpy()
+        matched_eofs.loc[sub_df.index, 'fpit_surfp'] = interp_surfp[:nobs]
+
+    # Columns in alphabetical order, as they were when this was built up with sorted concatenations
+    mod_df = pd.DataFrame(mod_rows, index=pd.DatetimeIndex(mod_times),
+                          columns=['day', 'mod_file', 'pbottom', 'psurf', 'site', 'year'])
 
     return matched_eofs, mod_df
 
 
+def _floor_to_3h(times) -> np.ndarray:
+    # Floor times to the 3-hourly GEOS times (00Z, 03Z, ...) all at once
+    hours = np.asarray(times, dtype='datetime64[h]').astype(np.int64)
+    return (hours // 3 * 3).astype('datetime64[h]').astype('datetime64[ns]')
+
+
 def load_eofs_with_fpit(sites: Sequence[str], match_kws: dict = None, fpit_kws: dict = None) -> (pd.DataFrame, pd.DataFrame):
     """
     Simultaneously load .eof.csv files and the associated FPIT surface pressure
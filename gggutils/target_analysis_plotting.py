@@ -34,12 +34,18 @@ def make_standard_comparison_plots(test_root_dir, save_file, matched_df=None):
 
     plots = {k: hist for k in hist_plots}
 
+    # Group on integer category codes rather than hashing the site strings for every plot. Done on a new dataframe
+    # so that the one passed in is not changed.
+    matched_df = matched_df.assign(site=matched_df['site'].astype('category'))
+    # Every column is plotted for the same sites, so only split the dataframe up once
+    site_groups = list(matched_df.groupby('site', observed=True))
+
     with PdfPages(save_file) as pdf:
         for column, plot_type in plots.items():
             print('Plotting {} for '.format(column), end='')
             old_column = old_varnames[column] if column in old_varnames else None
 
-            for site, site_df in matched_df.groupby('site'):
+            for site, site_df in site_groups:
                 print(site, end=' ')
                 comp.plot_comparison(matched_df=site_df, column=column, old_column=old_column, xraw=False,
                                      plot_type=plot_type, hlines=[0], pdf=pdf, suptitle=site)
@@ -1,10 +1,17 @@
-from glob import glob
+from functools import lru_cache
 import os
 import re
 
 from . import runutils
 
 
+# Date part of a target date directory name (xxYYYYMMDD), either just the date or with the site abbreviation
+_date_re = re.compile(r'(?<=\w\w)\d{8}')
+_full_date_re = re.compile(r'\w\w\d{8}')
+# Number of a revision subdirectory, e.g. "R1"
+_rev_num_re = re.compile(r'\d+')
+
+
 def tabulate_targets(out_file, target_dirs, dirs_list=None):
     """
     Create a .csv file indicating which data revisions for target data contain which dates
@@ -30,13 +37,11 @@ def tabulate_targets(out_file, target_dirs, dirs_list=None):
             date_dict = build_target_date_dict(tdir)
             rev_names = list_revisions(date_dict)
 
-            wobj.write(tname + '\n')
-            wobj.write('Date,top dir,' + ','.join(rev_names[1:]) + '\n')
-            for dstr in sorted(date_dict.keys()):
-                line = dstr + ',' + ','.join('x' if date_dict[dstr][r] else ' ' for r in rev_names)
-                wobj.write(line + '\n')
-
-            wobj.write('\n')
+            # Write each target's table in one go rather than line by line
+            lines = [tname, 'Date,top dir,' + ','.join(rev_names[1:])]
+            lines.extend(dstr + ',' + ','.join('x' if date_dict[dstr][r] else ' ' for r in rev_names)
+                         for dstr in sorted(date_dict.keys()))
+            wobj.write('\n'.join(lines) + '\n\n')
 
 
 def build_target_dirs_dict(target_dirs, dirs_list=None, key_by_basename=True, **kwargs):
@@ -96,21 +101,17 @@ def build_target_date_dict(target_dir, flat=False, full_datestr=False):
      date. This assumes that the top directory is always the most recent revision.
     :rtype: dict
     """
-    rev_dirs = ['.'] + glob(os.path.join(target_dir, 'R?'))
-    rev_names = [os.path.basename(r) for r in rev_dirs]
-    date_re = re.compile(r'\w\w\d{8}') if full_datestr else re.compile(r'(?<=\w\w)\d{8}')
+    rev_names = ['.'] + [name for name in _list_entry_names(target_dir) if len(name) == 2 and name.startswith('R')]
     date_dict = dict()
-    for rdir, rname in zip(rev_dirs, rev_names):
-        date_dirs = glob(os.path.join(target_dir, rname, '*'))
-        for ddir in date_dirs:
-            datestr = date_re.search(os.path.basename(ddir))
+    for rname in rev_names:
+        for name in _list_entry_names(os.path.join(target_dir, rname)):
+            datestr = _find_datestr(name, full_datestr)
             if datestr is None:
                 # not a date dir
                 continue
 
-            datestr = datestr.group()
             if datestr not in date_dict:
-                date_dict[datestr] = {r: False for r in rev_names}
+                date_dict[datestr] = dict.fromkeys(rev_names, False)
             date_dict[datestr][rname] = True
 
     if flat:
@@ -118,6 +119,27 @@ def build_target_date_dict(target_dir, flat=False, full_datestr=False):
     return date_dict
 
 
+def _find_datestr(name, full_datestr=False):
+    # Target date directories are normally named xxYYYYMMDD, in which case the date can be sliced out directly. That is
+    # exactly where the regex would find it, so the regex is only needed for other names.
+    if len(name) >= 10 and name[:2].isascii() and name[:2].isalpha() and name[2:10].isascii() and name[2:10].isdigit():
+        return name[:10] if full_datestr else name[2:10]
+
+    date_re = _full_date_re if full_datestr else _date_re
+    datestr = date_re.search(name)
+    return None if datestr is None else datestr.group()
+
+
+def _list_entry_names(directory):
+    # Names of the non-hidden entries in a directory, the same as a "*" glob would find but without building and
+    # matching full paths. Like the glob, a directory that is missing or cannot be read just has no entries.
+    try:
+        with os.scandir(directory) as entries:
+            return [e.name for e in entries if not e.name.startswith('.')]
+    except OSError:
+        return []
+
+
 def flatten_target_dir_dict(date_dict):
     """
     Flatten a dictionary from two levels (date, revision) to one (date with most recent revision).
@@ -128,10 +150,15 @@ def flatten_target_dir_dict(date_dict):
     :return: the flattened dictionary.
     """
     flat_dict = dict()
+    # Every date normally has the same revisions, so only sort each distinct set of them once
+    ordered_revisions_cache = dict()
 
     for datestr, rev_dict in date_dict.items():
         flat_dict[datestr] = None
-        ordered_revisions = sort_rev_names(rev_dict.keys(), highest_first=True)
+        rev_key = tuple(rev_dict.keys())
+        if rev_key not in ordered_revisions_cache:
+            ordered_revisions_cache[rev_key] = sort_rev_names(rev_key, highest_first=True)
+        ordered_revisions = ordered_revisions_cache[rev_key]
         for rev in ordered_revisions:
             if rev_dict[rev]:
                 flat_dict[datestr] = rev
@@ -156,7 +183,7 @@ def list_revisions(date_dict, sort_highest_first=True):
     """
     revisions = set()
     for subdict in date_dict.values():
-        revisions.add(subdict.keys())
+        revisions.update(subdict.keys())
 
     return sort_rev_names(list(revisions), highest_first=sort_highest_first)
 
@@ -178,7 +205,7 @@ def sort_rev_names(rev_names, highest_first=True):
         if rev == '.':
             return -9999
 
-        rind = int(re.search(r'\d+', rev).group())
+        rind = _rev_number(rev)
         if not highest_first:
             rind *= -1
 
@@ -187,6 +214,12 @@ def sort_rev_names(rev_names, highest_first=True):
     return sorted(rev_names, key=rev_key)
 
 
+@lru_cache(maxsize=128)
+def _rev_number(rev):
+    # There are only a handful of distinct revision names, so remember their numbers rather than searching every time
+    return int(_rev_num_re.search(rev).group())
+
+
 def parse_tab_args(parser):
     parser.description = 'Create a .csv file tabulating the available dates for targets in different revisions'
     parser.add_argument('out_file', help='Path to write the .csv file out to')
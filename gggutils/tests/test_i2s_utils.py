@@ -1,5 +1,8 @@
 import os
+import shutil
+import tempfile
 import unittest
+from unittest import mock
 
 from .. import runutils
 from . import _test_data_dir
@@ -56,5 +59,72 @@ class TestInputs(unittest.TestCase):
             self.assertEqual(chk_str, self.slice_chk_str3, msg='Writing a multiline parameter (parameter 17) failed')
 
 
+
+class TestInputCache(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.input_file = os.path.join(tmp_dir, 'slice-i2s.in')
+        shutil.copy(os.path.join(_test_data_dir, 'slice-i2s.in'), self.input_file)
+        runutils.clear_i2s_input_cache()
+        self.addCleanup(runutils.clear_i2s_input_cache)
+
+    def read_counting_reads(self, **kwargs):
+        with mock.patch.object(runutils, '_read_i2s_file', wraps=runutils._read_i2s_file) as read_file:
+            params = runutils.read_i2s_input_params(self.input_file, **kwargs)
+        return params, read_file.call_count
+
+    def test_cached(self):
+        first, nreads = self.read_counting_reads()
+        self.assertEqual(nreads, 1)
+        second, nreads = self.read_counting_reads()
+        self.assertEqual(nreads, 0)
+        self.assertEqual(second, first)
+
+    def test_modified_file(self):
+        (header, _), _ = self.read_counting_reads()
+        self.assertEqual(header[7], './flimit.i2s')
+
+        # Replacing the file (as modify_i2s_input_params does) gives it a new inode
+        runutils.modify_i2s_input_params(self.input_file, 8, './flimit_new.i2s')
+        (header, _), nreads = self.read_counting_reads()
+        self.assertEqual(nreads, 1)
+        self.assertEqual(header[7], './flimit_new.i2s')
+
+        # Changing the file in place with a different modification time but the same size
+        st = os.stat(self.input_file)
+        with open(self.input_file) as robj:
+            contents = robj.read()
+        with open(self.input_file, 'w') as wobj:
+            wobj.write(contents.replace('./flimit_new.i2s', './flimit_mod.i2s'))
+        os.utime(self.input_file, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        (header, _), nreads = self.read_counting_reads()
+        self.assertEqual(nreads, 1)
+        self.assertEqual(header[7], './flimit_mod.i2s')
+
+    def test_clear_cache(self):
+        self.read_counting_reads()
+        runutils.clear_i2s_input_cache()
+        _, nreads = self.read_counting_reads()
+        self.assertEqual(nreads, 1)
+
+    def test_mutating_results(self):
+        header, run_lines = runutils.read_i2s_input_params(self.input_file)
+        expected_header = list(header)
+        expected_run_line = dict(run_lines[0])
+        header[7] = './changed.i2s'
+        header.append('extra')
+        run_lines[0]['year'] = '1999'
+        run_lines.append({})
+
+        header, run_lines = runutils.read_i2s_input_params(self.input_file)
+        self.assertEqual(header, expected_header)
+        self.assertEqual(run_lines, [expected_run_line])
+
+        verbatim_lines = runutils.read_i2s_input_params(self.input_file, verbatim_run_lines=True)[1]
+        verbatim_lines[0] = 'changed'
+        self.assertNotEqual(runutils.read_i2s_input_params(self.input_file, verbatim_run_lines=True)[1][0], 'changed')
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,257 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from . import _test_data_dir
+
+try:
+    from .. import readers
+    import netCDF4 as ncdf
+except ImportError:
+    # readers needs jllutils and netCDF4
+    readers = None
+
+try:
+    import dask
+    import xarray as xr
+except ImportError:
+    # only needed for read_multi_nc_xarray
+    xr = None
+
+
+# The results the original line-by-line .mav reader gave for test.mav: the cell levels (heights of -9.9 and -8.8 km) are
+# removed but each block keeps the row numbers from the file.
+_mav_spectra = ['pa20200101saaaaa.043', 'pa20200101saaaab.043', 'pa20200102saaaaa.043']
+_mav_times = [pd.Timestamp(2020, 1, 1, 20), pd.Timestamp(2020, 1, 1, 21), pd.Timestamp(2020, 1, 2, 14)]
+_mav_blocks = [
+    {'Height': [0.0, 1.0, 2.0], 'Temp': [270.1, 265.3, 259.8], 'Pres': [982.4, 871.0, 771.5],
+     '1h2o': [0.0012, 0.00087, 0.00052]},
+    {'Height': [0.0, 1.0, 2.0], 'Temp': [271.1, 266.3, 260.8], 'Pres': [980.4, 869.0, 769.5],
+     '1h2o': [0.0024, 0.00174, 0.00104]},
+    {'Height': [0.0, 1.0, 2.0], 'Temp': [272.1, 267.3, 261.8], 'Pres': [978.4, 867.0, 767.5],
+     '1h2o': [0.0036, 0.00261, 0.00156]},
+]
+
+# The spectra and times of the rows in test.eof.csv, along with their flags
+_eof_spectra = ['pa20200101saaaaa.043', 'pa20200101saaaab.043', 'pa20200101saaaac.043', 'pa20200101saaaad.043',
+                'pa20200101saaaae.043', 'pa20200102saaaaa.043', 'pa20200102saaaab.043', 'pa20200102saaaac.043']
+_eof_times = pd.DatetimeIndex(['2020-01-01 20:07:30', '2020-01-01 20:22:30', '2020-01-01 20:37:30',
+                               '2020-01-01 20:52:30', '2020-01-01 21:07:30', '2020-01-02 14:30:00',
+                               '2020-01-02 14:45:00', '2020-01-02 15:00:00'])
+_eof_flags = [0, 0, 21, 0, 2, 0, 0, 21]
+
+
+def _expected_mav_dict(keys):
+    return {k: pd.DataFrame(block, index=pd.RangeIndex(2, 5)) for k, block in zip(keys, _mav_blocks)}
+
+
+@unittest.skipIf(readers is None, 'readers could not be imported')
+class TestReadMavFile(unittest.TestCase):
+    mav_file = os.path.join(_test_data_dir, 'test.mav')
+
+    def assert_mav_dict_equal(self, actual, expected):
+        self.assertEqual(list(actual.keys()), list(expected.keys()))
+        for k, table in expected.items():
+            pd.testing.assert_frame_equal(actual[k], table, obj='Block {}'.format(k))
+
+    def test_spectrum_indexing(self):
+        mav_dict = readers.read_mav_file(self.mav_file, indexing='spectrum')
+        self.assert_mav_dict_equal(mav_dict, _expected_mav_dict(_mav_spectra))
+
+    def test_datetime_indexing(self):
+        mav_dict = readers.read_mav_file(self.mav_file, indexing='datetime')
+        self.assert_mav_dict_equal(mav_dict, _expected_mav_dict(_mav_times))
+
+    def test_long_output(self):
+        for indexing, keys in [('spectrum', _mav_spectra), ('datetime', _mav_times)]:
+            with self.subTest(indexing=indexing):
+                mav_table = readers.read_mav_file(self.mav_file, indexing=indexing, output='long')
+                expected = pd.concat(_expected_mav_dict(keys).values())
+                pd.testing.assert_frame_equal(mav_table.reset_index(drop=True), expected.reset_index(drop=True))
+                self.assertEqual(mav_table.index.name, indexing)
+                self.assertEqual(list(mav_table.index), list(np.repeat(keys, 3)))
+
+    def test_bad_output(self):
+        with self.assertRaises(ValueError):
+            readers.read_mav_file(self.mav_file, output='wide')
+
+
+@unittest.skipIf(readers is None, 'readers could not be imported')
+class TestMavCache(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        # Work on a copy so that the cache files do not end up in the test data directory
+        self.mav_file = os.path.join(tmp_dir, 'test.mav')
+        shutil.copy(os.path.join(_test_data_dir, 'test.mav'), self.mav_file)
+
+    def test_dict_cache(self):
+        first = readers.read_mav_file(self.mav_file, cache=True)
+        self.assertTrue(os.path.exists(self.mav_file + '.spectrum.parquet'))
+        with mock.patch.object(readers, '_read_mav_blocks') as read_blocks:
+            second = readers.read_mav_file(self.mav_file, cache=True)
+            read_blocks.assert_not_called()
+
+        self.assertEqual(list(second.keys()), list(first.keys()))
+        for k in first:
+            pd.testing.assert_frame_equal(second[k], first[k])
+
+    def test_long_cache(self):
+        first = readers.read_mav_file(self.mav_file, indexing='datetime', cache=True, output='long')
+        self.assertTrue(os.path.exists(self.mav_file + '.datetime-long.parquet'))
+        with mock.patch.object(readers, '_read_mav_long') as read_long:
+            second = readers.read_mav_file(self.mav_file, indexing='datetime', cache=True, output='long')
+            read_long.assert_not_called()
+        pd.testing.assert_frame_equal(second, first)
+
+    def test_stale_cache(self):
+        readers.read_mav_file(self.mav_file, cache=True)
+        cache_file = self.mav_file + '.spectrum.parquet'
+        cache_time = os.stat(cache_file).st_mtime
+        os.utime(self.mav_file, (cache_time + 10, cache_time + 10))
+        with mock.patch.object(readers, '_read_mav_blocks', wraps=readers._read_mav_blocks) as read_blocks:
+            readers.read_mav_file(self.mav_file, cache=True)
+            read_blocks.assert_called_once()
+
+
+@unittest.skipIf(readers is None, 'readers could not be imported')
+class TestReadEngFile(unittest.TestCase):
+    eof_file = os.path.join(_test_data_dir, 'test.eof.csv')
+
+    def test_flag0(self):
+        df = readers.read_eng_file(self.eof_file)
+        xx = np.array(_eof_flags) == 0
+        self.assertEqual(list(df.columns), ['spectrum', 'year', 'day', 'hour', 'lat', 'long', 'flag', 'xluft'])
+        np.testing.assert_array_equal(df.index.to_numpy(), _eof_times[xx].to_numpy())
+        self.assertEqual(df['spectrum'].tolist(), list(np.array(_eof_spectra)[xx]))
+        np.testing.assert_array_equal(df['xluft'].to_numpy(), [0.9981, 0.9992, 1.0004, 0.9979, 1.0011])
+        self.assertEqual(df['year'].dtype, np.int64)
+        self.assertEqual(df['flag'].dtype, np.int64)
+
+    def test_allowed_flags(self):
+        df = readers.read_eng_file(self.eof_file, allowed_flags=(0, 2))
+        self.assertEqual(df['flag'].tolist(), [0, 0, 0, 2, 0, 0])
+        df = readers.read_eng_file(self.eof_file, allowed_flags='all')
+        self.assertEqual(df['flag'].tolist(), _eof_flags)
+        np.testing.assert_array_equal(df.index.to_numpy(), _eof_times.to_numpy())
+
+    def test_date_column(self):
+        df = readers.read_eng_file(self.eof_file, date_index=False)
+        self.assertEqual(df.index.tolist(), [0, 1, 3, 5, 6])
+        self.assertEqual(df.columns[-1], 'date')
+        np.testing.assert_array_equal(df['date'].to_numpy(), _eof_times[[0, 1, 3, 5, 6]].to_numpy())
+
+    def test_dates(self):
+        dates = pd.DatetimeIndex(['2020-01-01 20:20', '2020-01-02 14:40'])
+        for date_index in (True, False):
+            with self.subTest(date_index=date_index):
+                df = readers.read_eng_file(self.eof_file, date_index=date_index, compute_date=False, dates=dates)
+                self.assertEqual(df['spectrum'].tolist(), [_eof_spectra[i] for i in (1, 3, 5)])
+
+    def test_usecols(self):
+        df = readers.read_eng_file(self.eof_file, usecols=['xluft', 'not_a_column'])
+        self.assertEqual(list(df.columns), ['year', 'day', 'hour', 'flag', 'xluft'])
+        full_df = readers.read_eng_file(self.eof_file)
+        pd.testing.assert_frame_equal(df, full_df[df.columns])
+
+    def test_csv_engines(self):
+        # The pyarrow reader (used when available) should give the same table as the default pandas reader
+        with mock.patch.object(readers, '_eof_csv_engine', 'c'):
+            c_df = readers.read_eng_file(self.eof_file, allowed_flags='all')
+        df = readers.read_eng_file(self.eof_file, allowed_flags='all')
+        pd.testing.assert_frame_equal(df, c_df)
+
+
+# Values for the small netCDF files written by TestReadMultiNc: one file per list entry
+_nc_spectra = [['pa20200101saaaaa.043', 'pa20200101saaaab.043', 'pa20200101saaaac.043'],
+               ['pa20200102saaaaa.043', 'pa20200102saaaab.043']]
+_nc_xco2 = [[410.12, 411.46, 412.79], [409.87, 410.5]]
+_nc_flags = [[0, 2, 0], [0, 0]]
+
+
+def _write_test_nc(nc_file, ifile):
+    ntime = len(_nc_spectra[ifile])
+    with ncdf.Dataset(nc_file, 'w') as ds:
+        ds.createDimension('time', ntime)
+        ds.createDimension('specname', 20)
+        ds.createVariable('time', 'f8', ('time',))[:] = np.arange(ntime) + 100 * ifile
+        ds.createVariable('flag', 'i4', ('time',))[:] = _nc_flags[ifile]
+        # Character array that netCDF4 converts to strings on reading, as in the private files
+        spectrum = ds.createVariable('spectrum', 'S1', ('time', 'specname'))
+        spectrum._Encoding = 'ascii'
+        spectrum[:] = np.array(_nc_spectra[ifile], dtype='S20')
+        # Packed variable that netCDF4 unpacks to floats on reading
+        xco2 = ds.createVariable('xco2', 'i2', ('time',))
+        xco2.scale_factor = 0.01
+        xco2.add_offset = 400.0
+        xco2[:] = _nc_xco2[ifile]
+
+
+@unittest.skipIf(readers is None, 'readers could not be imported')
+class TestReadMultiNc(unittest.TestCase):
+    variables = ['time', 'flag', 'spectrum', 'xco2']
+
+    def setUp(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.nc_files = [os.path.join(tmp_dir, 'test{}.nc'.format(i)) for i in range(len(_nc_spectra))]
+        for i, nc_file in enumerate(self.nc_files):
+            _write_test_nc(nc_file, i)
+
+    def test_string_variable(self):
+        df = readers.read_multi_nc_dataframe(self.nc_files, ['spectrum'], quiet=True)
+        self.assertEqual(df['spectrum'].tolist(), _nc_spectra[0] + _nc_spectra[1])
+
+    def test_packed_variable(self):
+        df = readers.read_multi_nc_dataframe(self.nc_files, ['xco2'], quiet=True)
+        self.assertEqual(df['xco2'].dtype, np.float64)
+        np.testing.assert_allclose(df['xco2'].to_numpy(), _nc_xco2[0] + _nc_xco2[1])
+
+    def _concat_file_reads(self, flag0_only):
+        # What reading each file on its own and concatenating the results gives
+        dfs = []
+        for nc_file in self.nc_files:
+            with ncdf.Dataset(nc_file) as ds:
+                qq = ds['flag'][:] == 0 if flag0_only else slice(None)
+                df = pd.DataFrame({v: ds[v][:][qq] for v in self.variables})
+            df['file'] = nc_file
+            dfs.append(df)
+        return pd.concat(dfs, ignore_index=True)
+
+    def test_parallel(self):
+        for flag0_only in (False, True):
+            expected = self._concat_file_reads(flag0_only)
+            for nprocs in (1, 2):
+                with self.subTest(flag0_only=flag0_only, nprocs=nprocs):
+                    df = readers.read_multi_nc_dataframe(self.nc_files, self.variables, flag0_only=flag0_only,
+                                                         quiet=True, nprocs=nprocs)
+                    pd.testing.assert_frame_equal(df, expected, check_dtype=False, check_categorical=False)
+                    self.assertEqual(df['xco2'].dtype, np.float64)
+
+    def test_file_column(self):
+        df = readers.read_multi_nc_dataframe(self.nc_files, ['time'], flag0_only=True, quiet=True)
+        self.assertIsInstance(df['file'].dtype, pd.CategoricalDtype)
+        self.assertEqual(list(df['file'].cat.categories), self.nc_files)
+        self.assertEqual(df['file'].tolist(), [self.nc_files[0]] * 2 + [self.nc_files[1]] * 2)
+
+    @unittest.skipIf(xr is None, 'xarray and dask are needed for read_multi_nc_xarray')
+    def test_xarray_lazy(self):
+        for flag0_only in (False, True):
+            with self.subTest(flag0_only=flag0_only):
+                eager = readers.read_multi_nc_xarray(self.nc_files, self.variables, flag0_only=flag0_only, quiet=True)
+                lazy = readers.read_multi_nc_xarray(self.nc_files, self.variables, flag0_only=flag0_only, quiet=True,
+                                                    lazy=True)
+                with lazy:
+                    xr.testing.assert_identical(lazy.load(), eager)
+                df = readers.read_multi_nc_dataframe(self.nc_files, self.variables, flag0_only=flag0_only, quiet=True)
+                np.testing.assert_allclose(eager['xco2'].values, df['xco2'].to_numpy())
+                self.assertEqual(eager['time_file'].values.tolist(), df['file'].tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+from glob import glob
+import ntpath
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from configobj import ConfigObj
+
+from .. import runutils, exceptions
+
+
+class TestFindSiteDatekey(unittest.TestCase):
+    def setUp(self):
+        cfg = ConfigObj({'Sites': {'pa': {'site_root_dir': '/data', 'pa20200101': {}, 'pa20200102': {}}}})
+        self.site_cfg = cfg['Sites']['pa']
+
+    def test_find(self):
+        self.assertEqual(runutils._find_site_datekey(self.site_cfg, 'pa20200102'), 'pa20200102')
+        self.assertEqual(runutils._find_site_datekey(self.site_cfg, '20200102'), 'pa20200102')
+        self.assertEqual(runutils._find_site_datekey(self.site_cfg, '0200102'), 'pa20200102')
+        with self.assertRaises(exceptions.SiteDateException):
+            runutils._find_site_datekey(self.site_cfg, '20200103')
+
+    def test_rename(self):
+        # Look up first so that there is an index of the keys to go stale
+        runutils._find_site_datekey(self.site_cfg, '20200102')
+        self.site_cfg.rename('pa20200102', 'pa20200103')
+        self.assertEqual(runutils._find_site_datekey(self.site_cfg, '20200103'), 'pa20200103')
+        with self.assertRaises(exceptions.SiteDateException):
+            runutils._find_site_datekey(self.site_cfg, '20200102')
+
+    def test_pop_and_add(self):
+        # Removing one key and adding another leaves the number of keys the same
+        runutils._find_site_datekey(self.site_cfg, '20200102')
+        self.site_cfg.pop('pa20200102')
+        self.site_cfg['pa20200104'] = {}
+        self.assertEqual(runutils._find_site_datekey(self.site_cfg, '20200104'), 'pa20200104')
+        with self.assertRaises(exceptions.SiteDateException):
+            runutils._find_site_datekey(self.site_cfg, '20200102')
+
+    def test_first_match(self):
+        # As when searching the keys in order, the first key ending in the date is found. Moving the key that matched
+        # to the end must change which one that is.
+        self.site_cfg['xx20200101'] = {}
+        self.assertEqual(runutils._find_site_datekey(self.site_cfg, '20200101'), 'pa20200101')
+        self.site_cfg['pa20200101'] = self.site_cfg.pop('pa20200101')
+        self.assertEqual(runutils._find_site_datekey(self.site_cfg, '20200101'), 'xx20200101')
+
+
+class TestFindByGlob(unittest.TestCase):
+    patterns = ('A*.txt', 'a*.txt', '*.TXT', 'abc.*', 'ABC.TXT', '?bd.txt', '[Aa]bc.txt', '.h*', '*')
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        for name in ('Abc.txt', 'abc.TXT', 'aBd.txt', '.hidden'):
+            with open(os.path.join(self.tmp_dir, name), 'w'):
+                pass
+
+    def assert_matches_glob(self):
+        for pattern in self.patterns:
+            pattern = os.path.join(self.tmp_dir, pattern)
+            with self.subTest(pattern=pattern):
+                files = glob(pattern)
+                if len(files) == 1:
+                    self.assertEqual(runutils.find_by_glob(pattern), files[0])
+                else:
+                    with self.assertRaisesRegex(IOError, '^{} files'.format(len(files))):
+                        runutils.find_by_glob(pattern)
+
+    def test_platform_case(self):
+        self.assert_matches_glob()
+
+    def test_case_insensitive_platform(self):
+        # Like glob, matching follows os.path.normcase, which on Windows lower cases the names and patterns. glob itself
+        # cannot be made to act as on Windows here, so check the expected matches directly.
+        with mock.patch('os.path.normcase', ntpath.normcase):
+            self.assertEqual(runutils.find_by_glob(os.path.join(self.tmp_dir, '?BD.TXT')),
+                             os.path.join(self.tmp_dir, 'aBd.txt'))
+            with self.assertRaisesRegex(IOError, '^2 files'):
+                runutils.find_by_glob(os.path.join(self.tmp_dir, '[A]BC.TXT'))
+
+
+if __name__ == '__main__':
+    unittest.main()
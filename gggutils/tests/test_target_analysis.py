@@ -0,0 +1,290 @@
+from functools import partial
+import os
+import shutil
+import sys
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from . import _test_data_dir
+
+try:
+    from .. import target_analysis
+    from ..exceptions import TimeMatchError
+    from ..readers import read_eng_file
+except ImportError:
+    # target_analysis needs the readers module, which needs jllutils
+    target_analysis = None
+
+
+def _mod_file_name(geos_time, lat, lon):
+    return 'FPIT_{:%Y%m%d%H}Z_{:.0f}N_{:.0f}E.mod'.format(geos_time, lat, lon)
+
+
+@unittest.skipIf(target_analysis is None, 'target_analysis could not be imported')
+class TestAddFpitPres(unittest.TestCase):
+    # GEOS surface pressure at each 3-hourly time, chosen so that it is linear in time
+    geos_pres = {pd.Timestamp(2020, 1, 5, 21): 1000.0,
+                 pd.Timestamp(2020, 1, 6, 0): 1003.0,
+                 pd.Timestamp(2020, 1, 6, 3): 1006.0,
+                 pd.Timestamp(2020, 1, 6, 6): 1009.0}
+
+    def setUp(self):
+        pres_by_file = {os.path.join('mods', _mod_file_name(t, 45, -90)): p for t, p in self.geos_pres.items()}
+
+        def read_mod_file(mod_file):
+            p = pres_by_file[mod_file]
+            return {'scalar': {'Pressure': p}, 'profile': {'Pressure': np.array([p + 1, p - 50])}}
+
+        self.mod_utils = mock.Mock(mod_file_name_for_priors=mock.Mock(side_effect=_mod_file_name))
+        self.readers = mock.Mock(read_mod_file=mock.Mock(side_effect=read_mod_file))
+        common_utils = types.ModuleType('ginput.common_utils')
+        common_utils.mod_utils = self.mod_utils
+        common_utils.readers = self.readers
+        ginput = types.ModuleType('ginput')
+        ginput.common_utils = common_utils
+        patcher = mock.patch.dict(sys.modules, {'ginput': ginput, 'ginput.common_utils': common_utils})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _matched_eofs(self):
+        # Two days at one site: the first only needs the 21Z and 00Z files, the second the 00Z, 03Z, and 06Z files.
+        # The 03Z observation falls exactly on a GEOS time. The integer index is deliberately not 0..N-1.
+        dates = pd.to_datetime(['2020-01-06 04:30', '2020-01-05 22:30', '2020-01-06 03:00', '2020-01-06 01:30'])
+        return pd.DataFrame({'site': 'pa', 'year_new': 2020, 'day_new': [6, 5, 6, 6], 'date_new': dates,
+                             'lat_deg_new': 45.0, 'long_deg_new': -90.0, 'xluft_new': [0.99, 1.0, 1.01, 1.02]},
+                            index=[10, 20, 30, 40])
+
+    def test_fpit_surfp(self):
+        matched_eofs = self._matched_eofs()
+        new_eofs, mod_df = target_analysis.add_fpit_pres(matched_eofs, mod_dir='mods')
+
+        np.testing.assert_allclose(new_eofs['fpit_surfp'].to_numpy(), [1007.5, 1001.5, 1006.0, 1004.5])
+        pd.testing.assert_index_equal(new_eofs.index, pd.RangeIndex(4))
+        pd.testing.assert_frame_equal(new_eofs.drop(columns='fpit_surfp'), matched_eofs.reset_index(drop=True))
+        self.assertNotIn('fpit_surfp', matched_eofs.columns, msg='The input dataframe was modified')
+
+    def test_mod_df(self):
+        _, mod_df = target_analysis.add_fpit_pres(self._matched_eofs(), mod_dir='mods')
+
+        self.assertEqual(list(mod_df.columns), ['day', 'mod_file', 'pbottom', 'psurf', 'site', 'year'])
+        expected_times = pd.DatetimeIndex(['2020-01-05 21:00', '2020-01-06 00:00', '2020-01-06 00:00',
+                                           '2020-01-06 03:00', '2020-01-06 06:00'])
+        np.testing.assert_array_equal(mod_df.index.to_numpy(), expected_times.to_numpy())
+        self.assertEqual(mod_df['day'].tolist(), [5, 5, 6, 6, 6])
+        self.assertEqual(mod_df['psurf'].tolist(), [1000.0, 1003.0, 1003.0, 1006.0, 1009.0])
+        self.assertEqual(mod_df['pbottom'].tolist(), [1001.0, 1004.0, 1004.0, 1007.0, 1010.0])
+        self.assertEqual(mod_df['mod_file'].iloc[0], os.path.join('mods', 'FPIT_2020010521Z_45N_-90E.mod'))
+
+    def test_mod_files_read_once(self):
+        target_analysis.add_fpit_pres(self._matched_eofs(), mod_dir='mods')
+        # The 00Z file is needed by both days but should only be read once
+        self.assertEqual(self.readers.read_mod_file.call_count, 4)
+
+
+def _match_by_comparison(old_df, new_df, req_columns, max_timedelta):
+    # The original way of matching: compare each new time against every old time
+    old_inds = []
+    new_inds = []
+    for inew, new_time in enumerate(new_df.index):
+        timediffs = np.abs(old_df.index - new_time)
+        old_ind = np.flatnonzero(timediffs < max_timedelta)
+        if old_ind.size > 1:
+            raise TimeMatchError('{} times matched for {}'.format(old_ind.size, new_time))
+        elif old_ind.size == 1:
+            old_inds.append(old_ind.item())
+            new_inds.append(inew)
+
+    old_df = old_df.rename(columns=lambda c: c.replace('air', 'luft'))
+    old_df = old_df.iloc[old_inds].reset_index().rename(columns={'index': 'date'}).loc[:, list(req_columns)]
+    new_df = new_df.iloc[new_inds].reset_index().rename(columns={'index': 'date'}).loc[:, list(req_columns)]
+    old_df.columns = [k + '_old' for k in old_df.columns]
+    new_df.columns = [k + '_new' for k in new_df.columns]
+    combo_df = old_df.join(new_df, how='inner')
+    combo_df['site'] = 'pa'
+    return combo_df
+
+
+@unittest.skipIf(target_analysis is None, 'target_analysis could not be imported')
+class TestMatchTestToDelivered(unittest.TestCase):
+    # The delivered files use GGG2014 names (xair, column_air) and the test file GGG2020 names (xluft, column_luft)
+    new_eof_file = os.path.join(_test_data_dir, 'target_new.eof.csv')
+    req_columns = target_analysis._def_req_cols if target_analysis is not None else None
+
+    def setUp(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        # Work on a copy so that the caches do not end up in the test data directory
+        self.root_dir = os.path.join(tmp_dir, 'root')
+        shutil.copytree(os.path.join(_test_data_dir, 'target_root'), self.root_dir)
+        patcher = mock.patch.object(target_analysis, '_root_dir', self.root_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _old_df(self):
+        site_dir = os.path.join(self.root_dir, 'ParkFalls')
+        date_dirs = sorted(os.listdir(site_dir))
+        return pd.concat([read_eng_file(os.path.join(site_dir, d, d + '.eof.csv')) for d in date_dirs])
+
+    def test_match(self):
+        combo_df = target_analysis.match_test_to_delivered_data('pa', self.new_eof_file)
+        expected = _match_by_comparison(self._old_df(), read_eng_file(self.new_eof_file), self.req_columns,
+                                        pd.Timedelta(seconds=3))
+        # Only flag 0 data is read by default, and the rows 18 and 3.6 seconds from any delivered observation have no
+        # match, so only the first two new observations are kept
+        self.assertEqual(len(combo_df), 2)
+        pd.testing.assert_frame_equal(combo_df, expected)
+        self.assertEqual(combo_df['xluft_old'].tolist(), [0.9981, 0.9992])
+        self.assertEqual(combo_df['xluft_new'].tolist(), [0.9990, 0.9995])
+
+    def test_unordered_delivered_data(self):
+        # Reading the delivered files in reverse date order must not change the matches
+        def reversed_scan(site_dir, site_abbrev):
+            return type(scan(site_dir, site_abbrev))(reversed(scan(site_dir, site_abbrev).items()))
+
+        scan = target_analysis._scan_site_eofs
+        expected = target_analysis.match_test_to_delivered_data('pa', self.new_eof_file)
+        with mock.patch.object(target_analysis, '_scan_site_eofs', side_effect=reversed_scan):
+            combo_df = target_analysis.match_test_to_delivered_data('pa', self.new_eof_file)
+        pd.testing.assert_frame_equal(combo_df, expected)
+
+    def test_multiple_matches(self):
+        # At 40 s, the second new observation is within range of the first and second delivered observations
+        with self.assertRaises(TimeMatchError):
+            target_analysis.match_test_to_delivered_data('pa', self.new_eof_file,
+                                                         max_timedelta=pd.Timedelta(seconds=40))
+
+    def test_qual_filter(self):
+        # Read all the flags so that there is something to filter: one match has old flag 2, another new flag 1
+        read_all_flags = partial(read_eng_file, allowed_flags='all')
+        with mock.patch.object(target_analysis, 'read_eng_file', read_all_flags):
+            for qual, nrows in [('none', 4), ('old', 3), ('new', 3), ('both', 2)]:
+                with self.subTest(do_qual_filter=qual):
+                    combo_df = target_analysis.match_test_to_delivered_data('pa', self.new_eof_file,
+                                                                            do_qual_filter=qual)
+                    self.assertEqual(len(combo_df), nrows)
+        with self.assertRaises(ValueError):
+            target_analysis.match_test_to_delivered_data('pa', self.new_eof_file, do_qual_filter='neither')
+
+    def test_all_columns(self):
+        combo_df = target_analysis.match_test_to_delivered_data('pa', self.new_eof_file, req_columns='all')
+        limited_df = target_analysis.match_test_to_delivered_data('pa', self.new_eof_file)
+        self.assertIn('column_luft_old', combo_df.columns)
+        pd.testing.assert_frame_equal(combo_df.loc[:, limited_df.columns], limited_df)
+
+    def test_cache(self):
+        cache_file = os.path.join(self.root_dir, 'ParkFalls', '.pa_all_eofs.feather')
+        expected = target_analysis.match_test_to_delivered_data('pa', self.new_eof_file)
+        first = target_analysis.match_test_to_delivered_data('pa', self.new_eof_file, cache=True)
+        self.assertTrue(os.path.exists(cache_file))
+        with mock.patch.object(target_analysis, '_read_scanned_date_dir_eof') as read_date_dir:
+            second = target_analysis.match_test_to_delivered_data('pa', self.new_eof_file, cache=True)
+            read_date_dir.assert_not_called()
+        pd.testing.assert_frame_equal(first, expected)
+        pd.testing.assert_frame_equal(second, expected)
+
+
+@unittest.skipIf(target_analysis is None, 'target_analysis could not be imported')
+class TestEofCache(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.root_dir = os.path.join(tmp_dir, 'root')
+        shutil.copytree(os.path.join(_test_data_dir, 'target_root'), self.root_dir)
+        self.site_dir = os.path.join(self.root_dir, 'ParkFalls')
+        self.cache_file = os.path.join(self.site_dir, '.pa_all_eofs.feather')
+        patcher = mock.patch.object(target_analysis, '_root_dir', self.root_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cache_roundtrip(self):
+        expected = target_analysis.read_all_eofs_for_site('pa')
+        target_analysis.read_all_eofs_for_site('pa', cache=True)
+        df = target_analysis.read_all_eofs_for_site('pa', cache=True)
+        pd.testing.assert_frame_equal(df, expected, check_index_type=False)
+        np.testing.assert_array_equal(df.index.to_numpy(), expected.index.to_numpy())
+
+    def test_cache_usecols(self):
+        expected = target_analysis.read_all_eofs_for_site('pa', usecols=['xair'])
+        first = target_analysis.read_all_eofs_for_site('pa', cache=True, usecols=['xair'])
+        second = target_analysis.read_all_eofs_for_site('pa', cache=True, usecols=['xair'])
+        self.assertEqual(list(expected.columns), ['year', 'day', 'hour', 'flag', 'xair'])
+        pd.testing.assert_frame_equal(first, expected, check_index_type=False)
+        pd.testing.assert_frame_equal(second, expected, check_index_type=False)
+        # The cache keeps all the columns, whichever were requested when it was made
+        all_cols = target_analysis.read_all_eofs_for_site('pa', cache=True)
+        self.assertIn('xco2_ppm', all_cols.columns)
+
+    def test_stale_cache(self):
+        target_analysis.read_all_eofs_for_site('pa', cache=True)
+        cache_time = os.path.getmtime(self.cache_file)
+        eof_file = os.path.join(self.site_dir, 'pa20200102', 'pa20200102.eof.csv')
+        os.utime(eof_file, (cache_time + 10, cache_time + 10))
+        with mock.patch.object(target_analysis, '_read_scanned_date_dir_eof',
+                               wraps=target_analysis._read_scanned_date_dir_eof) as read_date_dir:
+            target_analysis.read_all_eofs_for_site('pa', cache=True)
+            self.assertEqual(read_date_dir.call_count, 2)
+
+    def test_replaced_with_older_time(self):
+        # As when a file is copied in with its modification time preserved (cp -p, rsync -t)
+        target_analysis.read_all_eofs_for_site('pa', cache=True)
+        cache_time = os.path.getmtime(self.cache_file)
+        eof_file = os.path.join(self.site_dir, 'pa20200102', 'pa20200102.eof.csv')
+        with open(eof_file) as robj:
+            contents = robj.read()
+        with open(eof_file, 'w') as wobj:
+            wobj.write(contents.replace('1.0011', '1.0100'))
+        os.utime(eof_file, (cache_time - 1000, cache_time - 1000))
+
+        df = target_analysis.read_all_eofs_for_site('pa', cache=True, usecols=['xair'])
+        self.assertIn(1.01, df['xair'].tolist())
+        self.assertNotIn(1.0011, df['xair'].tolist())
+
+    def test_new_date_dir_with_older_time(self):
+        target_analysis.read_all_eofs_for_site('pa', cache=True)
+        cache_time = os.path.getmtime(self.cache_file)
+        new_dir = os.path.join(self.site_dir, 'pa20200103')
+        os.mkdir(new_dir)
+        new_file = os.path.join(new_dir, 'pa20200103.eof.csv')
+        with open(os.path.join(self.site_dir, 'pa20200102', 'pa20200102.eof.csv')) as robj:
+            contents = robj.read()
+        with open(new_file, 'w') as wobj:
+            wobj.write(contents.replace('2020,2,', '2020,3,'))
+        for path in (new_file, new_dir, self.site_dir):
+            os.utime(path, (cache_time - 1000, cache_time - 1000))
+
+        df = target_analysis.read_all_eofs_for_site('pa', cache=True)
+        self.assertEqual(len(df), 10)
+        self.assertIn(3, df['day'].tolist())
+
+
+@unittest.skipIf(target_analysis is None, 'target_analysis could not be imported')
+class TestTakeMatchedRows(unittest.TestCase):
+    def setUp(self):
+        index = pd.DatetimeIndex(['2020-01-01 12:00', '2020-01-01 12:01', '2020-01-01 12:02'])
+        self.df = pd.DataFrame({'flag': [0, 2, 0], 'xluft': [0.99, 1.0, 1.01], 'xco2_ppm': [410.0, 411.0, 412.0]},
+                               index=index)
+
+    def test_req_columns(self):
+        df = target_analysis._take_matched_rows(self.df, np.array([2, 0]), ('xluft', 'date', 'flag'), 'old')
+        self.assertEqual(list(df.columns), ['xluft', 'date', 'flag'])
+        pd.testing.assert_index_equal(df.index, pd.RangeIndex(2))
+        self.assertEqual(df['xluft'].tolist(), [1.01, 0.99])
+        self.assertEqual(df['date'].tolist(), [self.df.index[2], self.df.index[0]])
+
+    def test_all_columns(self):
+        df = target_analysis._take_matched_rows(self.df, np.array([1]), 'all', 'new')
+        self.assertEqual(list(df.columns), ['date', 'flag', 'xluft', 'xco2_ppm'])
+        self.assertEqual(df.iloc[0].tolist(), [self.df.index[1], 2, 1.0, 411.0])
+
+    def test_missing_columns(self):
+        with self.assertRaisesRegex(KeyError, 'new data frame: column_o2'):
+            target_analysis._take_matched_rows(self.df, np.array([0]), ('date', 'column_o2'), 'new')
+
+
+if __name__ == '__main__':
+    unittest.main()
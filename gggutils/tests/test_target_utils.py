@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from .. import target_utils
+
+
+class TestRevisions(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        # A target directory with the current data at the top level and two older revisions
+        self.target_dir = os.path.join(tmp_dir, 'Ascension')
+        for subdir in ('ae20200101', 'ae20200102', os.path.join('R1', 'ae20200101'), os.path.join('R0', 'ae20190101')):
+            os.makedirs(os.path.join(self.target_dir, subdir))
+
+    def test_list_revisions(self):
+        date_dict = target_utils.build_target_date_dict(self.target_dir)
+        self.assertEqual(target_utils.list_revisions(date_dict), target_utils.sort_rev_names(['.', 'R0', 'R1']))
+        self.assertEqual(target_utils.list_revisions(date_dict, sort_highest_first=False),
+                         target_utils.sort_rev_names(['.', 'R0', 'R1'], highest_first=False))
+
+    def test_list_revisions_differing_dates(self):
+        # Each date may list different revisions, the result should be the union of all of them
+        date_dict = {'20200101': {'.': True, 'R2': False}, '20200102': {'.': True, 'R1': True}}
+        self.assertEqual(target_utils.list_revisions(date_dict), target_utils.sort_rev_names(['.', 'R1', 'R2']))
+
+    def test_tabulate_targets(self):
+        out_file = os.path.join(os.path.dirname(self.target_dir), 'targets.csv')
+        target_utils.tabulate_targets(out_file, [self.target_dir])
+        with open(out_file) as robj:
+            self.assertEqual(robj.read(), 'Ascension\n'
+                                          'Date,top dir,R0,R1\n'
+                                          '20190101, ,x, \n'
+                                          '20200101,x, ,x\n'
+                                          '20200102,x, , \n'
+                                          '\n')
+
+
+
+class TestUnreadableDirs(unittest.TestCase):
+    # The glob these directory listings replaced silently skipped directories it could not read; so should they
+
+    def setUp(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.target_dir = os.path.join(tmp_dir, 'Ascension')
+        for subdir in ('ae20200101', os.path.join('R1', 'ae20191231')):
+            os.makedirs(os.path.join(self.target_dir, subdir))
+
+    def test_not_a_directory(self):
+        not_a_dir = os.path.join(self.target_dir, 'notes.txt')
+        with open(not_a_dir, 'w'):
+            pass
+        self.assertEqual(target_utils._list_entry_names(not_a_dir), [])
+        self.assertEqual(target_utils.build_target_date_dict(not_a_dir), dict())
+
+    def test_permission_error(self):
+        unreadable_dir = os.path.join(self.target_dir, 'R1')
+        real_scandir = os.scandir
+
+        def scandir(path):
+            if os.path.normpath(path) == unreadable_dir:
+                raise PermissionError(13, 'Permission denied', path)
+            return real_scandir(path)
+
+        with mock.patch.object(target_utils.os, 'scandir', side_effect=scandir):
+            self.assertEqual(target_utils._list_entry_names(unreadable_dir), [])
+            date_dict = target_utils.build_target_date_dict(self.target_dir)
+        self.assertEqual(date_dict, {'20200101': {'.': True, 'R1': False}})
+
+    def test_missing(self):
+        self.assertEqual(target_utils._list_entry_names(os.path.join(self.target_dir, 'R0')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
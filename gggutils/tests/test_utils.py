@@ -0,0 +1,56 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from .. import utils
+
+
+def _baseline_vpath_above_zmin(z, d, klev):
+    # The original calculation of the effective vertical paths above zmin, from gfit/compute_vertical_paths.f
+    def integral(dz_in, lrp_in, sign):
+        return dz_in * 0.5 * (1.0 + sign * lrp_in / 3 + lrp_in**2/12 + sign*lrp_in**3/60)
+
+    dz = np.concatenate([[0.0], np.diff(z[klev:]), [0.0]])
+    log_rp = np.log(d[klev:-1] / d[klev+1:])
+    log_rp = np.concatenate([[0.0], log_rp, [0.0]])
+    return integral(dz[1:], log_rp[1:], sign=-1) + integral(dz[:-1], log_rp[:-1], sign=1)
+
+
+class TestVerticalPath(unittest.TestCase):
+    def setUp(self):
+        # A profile like those in the .mod files: roughly exponential number density with uneven level spacing
+        self.z = np.concatenate([np.arange(0.0, 10.0, 0.5), np.arange(10.0, 71.0, 2.5)])
+        p = 1013.25 * np.exp(-self.z / 7.4)
+        t = np.interp(self.z, [0.0, 12.0, 20.0, 50.0, 70.0], [288.0, 216.0, 216.0, 270.0, 220.0])
+        self.nair = utils.number_density_air(p, t)
+        self.klevs = (1, 2, 7, 20, self.z.size - 2, self.z.size - 1)
+
+    def assert_matches_baseline(self, vpath_fxn):
+        for klev in self.klevs:
+            with self.subTest(klev=klev):
+                expected = _baseline_vpath_above_zmin(self.z, self.nair, klev)
+                np.testing.assert_allclose(vpath_fxn(self.z, self.nair, klev), expected, rtol=1e-12)
+
+    def test_numpy(self):
+        self.assert_matches_baseline(utils._vpath_above_zmin_numpy)
+
+    @unittest.skipIf(utils.njit is None, 'numba is not installed')
+    def test_numba(self):
+        self.assert_matches_baseline(utils._vpath_above_zmin)
+        # Also check the loop itself, since numba may compile it in a way that hides errors in the Python code
+        self.assert_matches_baseline(utils._vpath_above_zmin.py_func)
+
+    def test_effective_vertical_path(self):
+        for zmin in (0.25, 3.1, 12.0, 69.0):
+            with self.subTest(zmin=zmin):
+                vpath = utils.effective_vertical_path(self.z, zmin, nair=self.nair)
+                with mock.patch.object(utils, '_vpath_above_zmin', _baseline_vpath_above_zmin):
+                    expected = utils.effective_vertical_path(self.z, zmin, nair=self.nair)
+                np.testing.assert_allclose(vpath, expected, rtol=1e-12)
+                # Levels entirely below zmin do not contribute
+                self.assertTrue(np.all(vpath[self.z < zmin][:-1] == 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,14 @@
 import numpy as np
 from . import constants as const
 
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# Avogadro's number over the gas constant (in cm^3 * hPa / (mol * K)), so number density is this times p/T
+_nair_per_p_over_t = const.avogadro / const.gas_const
+
 
 def effective_vertical_path(z, zmin, p=None, t=None, nair=None):
     """  
@@ -23,9 +31,6 @@ def effective_vertical_path(z, zmin, p=None, t=None, nair=None):
     :return: effective vertical paths in the same units as ``z``
     :rtype: array-like
     """
-    def integral(dz_in, lrp_in, sign):
-        return dz_in * 0.5 * (1.0 + sign * lrp_in / 3 + lrp_in**2/12 + sign*lrp_in**3/60)
-
     if nair is not None:
         d = nair 
     elif p is not None and t is not None:
@@ -43,6 +48,28 @@ def effective_vertical_path(z, zmin, p=None, t=None, nair=None):
     except IndexError:
         klev = np.size(z) - 1
         
+    vpath[klev:] = _vpath_above_zmin(np.asarray(z), np.asarray(d), klev)
+
+    # Now handle the surface - I don't fully understand how this is constructed mathematically, but the idea is that both
+    # the levels in the prior above and below zmin need to contribute to the column, however that contribution needs to be
+    # 0 below zmin. 
+    
+    dz = z[klev] - z[klev-1]
+    xo = (zmin - z[klev-1])/dz
+    log_rp = 0.0 if d[klev] <= 0 else np.log(d[klev-1]/d[klev])
+    xl = log_rp * (1-xo)
+    vpath[klev-1] += dz * (1-xo) * (1-xo-xl*(1+2*xo)/3 + (xl**2)*(1+3*xo)/12 + (xl**3)*(1+4*xo)/60)/2
+    vpath[klev] += dz * (1-xo) * (1+xo+xl*(1+2*xo)/3 + (xl**2)*(1+3*xo)/12 - (xl**3)*(1+4*xo)/60)/2
+
+    return vpath
+
+
+def _integral(dz, lrp, sign):
+    # 0.5 * dz * (1 + sign*l/3 + l**2/12 + sign*l**3/60), in Horner form so that no powers of l are made
+    return dz * 0.5 * (1.0 + lrp * (sign/3 + lrp * (1/12 + sign*lrp/60)))
+
+
+def _vpath_above_zmin_numpy(z, d, klev):
     # from gfit/compute_vertical_paths.f, the calculation for level i is
     #   v_i = 0.5 * dz_{i+1} * (1 - l_{i+1}/3 + l_{i+1}**2/12 - l_{i+1}**3/60)
     #       + 0.5 * dz_i * (1 + l_i/3 + l_i**2/12 + l_i**3/60)
@@ -60,20 +87,25 @@ def effective_vertical_path(z, zmin, p=None, t=None, nair=None):
     # term is 0 (as vpath[klev] needs to account for the surface location below). For all other terms, this combines the
     # contributions from the weight above and below each level, with different integration signs to account for how the
     # weights increase from the level below to the current level and decrease from the current level to the level above.
-    vpath[klev:] = integral(dz[1:], log_rp[1:], sign=-1) + integral(dz[:-1], log_rp[:-1], sign=1)
-       
-    # Now handle the surface - I don't fully understand how this is constructed mathematically, but the idea is that both
-    # the levels in the prior above and below zmin need to contribute to the column, however that contribution needs to be
-    # 0 below zmin. 
-    
-    dz = z[klev] - z[klev-1]
-    xo = (zmin - z[klev-1])/dz
-    log_rp = 0.0 if d[klev] <= 0 else np.log(d[klev-1]/d[klev])
-    xl = log_rp * (1-xo)
-    vpath[klev-1] += dz * (1-xo) * (1-xo-xl*(1+2*xo)/3 + (xl**2)*(1+3*xo)/12 + (xl**3)*(1+4*xo)/60)/2
-    vpath[klev] += dz * (1-xo) * (1+xo+xl*(1+2*xo)/3 + (xl**2)*(1+3*xo)/12 - (xl**3)*(1+4*xo)/60)/2
+    return _integral(dz[1:], log_rp[1:], sign=-1) + _integral(dz[:-1], log_rp[:-1], sign=1)
 
-    return vpath
+
+if njit is not None:
+    @njit(cache=True)
+    def _vpath_above_zmin(z, d, klev):
+        # Same as the numpy version, but one pass over the layers above zmin adding each layer's contribution to the
+        # levels at its bottom and top, without the padded difference arrays. Profiles are short, so the numpy
+        # version's time is mostly spent creating its temporary arrays.
+        nlev = z.shape[0]
+        vpath = np.zeros(nlev - klev)
+        for i in range(klev, nlev - 1):
+            dz = z[i+1] - z[i]
+            log_rp = np.log(d[i] / d[i+1])
+            vpath[i - klev] += dz * 0.5 * (1.0 + log_rp * (-1/3 + log_rp * (1/12 - log_rp/60)))
+            vpath[i + 1 - klev] += dz * 0.5 * (1.0 + log_rp * (1/3 + log_rp * (1/12 + log_rp/60)))
+        return vpath
+else:
+    _vpath_above_zmin = _vpath_above_zmin_numpy
 
 
 def number_density_air(p, t):
@@ -89,5 +121,4 @@ def number_density_air(p, t):
     :return: ideal dry number density in molec. cm^-3
     :rtype: float or :class:`numpy.ndarray`
     """
-    R = const.gas_const  # gas constant in cm^3 * hPa / (mol * K)
-    return p / (R*t) * const.avogadro
\ No newline at end of file
+    return _nair_per_p_over_t * p / t
\ No newline at end of file